@@ -1,11 +1,18 @@
 from django.contrib import admin
-from osis_common.models import message_template, message_history, document_file, queue_exception
+from osis_common.models import message_template, message_history, document_file, queue_exception, \
+    sync_watermark, paper_sheet_job
 
 admin.site.register(message_template.MessageTemplate,
                     message_template.MessageTemplateAdmin)
 admin.site.register(message_history.MessageHistory,
                     message_history.MessageHistoryAdmin)
+admin.site.register(message_history.MessageHistoryArchive,
+                    message_history.MessageHistoryArchiveAdmin)
 admin.site.register(document_file.DocumentFile,
                     document_file.DocumentFileAdmin)
 admin.site.register(queue_exception.QueueException,
                     queue_exception.QueueExceptionAdmin)
+admin.site.register(sync_watermark.SyncWatermark,
+                    sync_watermark.SyncWatermarkAdmin)
+admin.site.register(paper_sheet_job.PaperSheetJob,
+                    paper_sheet_job.PaperSheetJobAdmin)
@@ -23,15 +23,25 @@
 #    see http://www.gnu.org/licenses/.
 #
 ##############################################################################
+import math
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from io import BytesIO
-from django.http import HttpResponse
+from wsgiref.util import FileWrapper
+from django.http import StreamingHttpResponse
 from django.conf import settings
+from django.utils import translation
+from PyPDF2 import PdfFileMerger, PdfFileReader
+from osis_common.document import pdf_cache
 from reportlab.lib.pagesizes import A4
-from reportlab.lib.enums import TA_JUSTIFY, TA_RIGHT, TA_CENTER, TA_LEFT
+from reportlab.lib.enums import TA_JUSTIFY, TA_CENTER, TA_LEFT
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, PageBreak, Table, TableStyle
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import mm
 from reportlab.lib import colors
+from reportlab.pdfbase.pdfmetrics import stringWidth
 from django.utils.translation import ugettext_lazy as _
 import datetime
 
@@ -40,13 +50,100 @@ PAGE_SIZE = A4
 MARGIN_SIZE = 15 * mm
 COLS_WIDTH = [20*mm, 55*mm, 45*mm, 15*mm, 40*mm]
 STUDENTS_PER_PAGE = 24
+# Default left and right padding of the cells of a Table
+CELL_PADDING = 6
+# Version of the rendering, to increment when the rendered sheets change (the cached sheets are rendered again)
+TEMPLATE_VERSION = 1
+# Number of processes rendering the parts of a document (1 renders the document in the current process)
+DEFAULT_WORKERS = 1
+# Shares of the progress of a parallel rendering (in percents) : rendering of the parts, then rendering again
+# of the parts whose pages are renumbered, then merge of the parts
+RENDER_PROGRESS = 80
+RENDER_AGAIN_PROGRESS = 95
+# The pdf of a response is kept in memory up to this size, then written on disk
+SPOOL_MAX_SIZE = 5 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+# Styles, decoded logos and translated texts are built once by process
+_styles = None
+_logos = {}
+_translated_texts = {}
+
+NORMAL_STYLE = ParagraphStyle('normal')
+TEXT_LEFT_STYLE = ParagraphStyle('structure_header', alignment=TA_LEFT, fontSize=10)
+INFO_STYLE = ParagraphStyle('info', alignment=TA_LEFT, fontSize=10)
+SIGNATURE_STYLE = ParagraphStyle('info', fontSize=10)
+LEGEND_STYLE = ParagraphStyle('legend', textColor='grey', borderColor='grey', borderWidth=1, alignment=TA_CENTER,
+                              fontSize=8, borderPadding=5)
+STUDENTS_TABLE_STYLE = TableStyle([
+    ('INNERGRID', (0, 0), (-1, -1), 0.25, colors.black),
+    ('BOX', (0, 0), (-1, -1), 0.25, colors.black),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ('BACKGROUND', (0, 0), (-1, 0), colors.grey)])
+HEADER_TABLE_STYLE = TableStyle([
+    ('LEFTPADDING', (0, 0), (-1, -1), 0),
+    ('RIGHTPADDING', (0, 0), (-1, -1), 0),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP')
+])
+
+
+def get_styles():
+    """
+    :return: The sample style sheet with the 'Justify' style, built once by process
+    """
+    global _styles
+    if _styles is None:
+        styles = getSampleStyleSheet()
+        styles.add(ParagraphStyle(name='Justify', alignment=TA_JUSTIFY))
+        _styles = styles
+    return _styles
+
+
+def _get_logo(path):
+    """
+    :return: The content of the logo file, read once by process
+    """
+    logo = _logos.get(path)
+    if logo is None:
+        with open(path, 'rb') as logo_file:
+            logo = logo_file.read()
+        _logos[path] = logo
+    return logo
+
+
+def _get_translated_texts():
+    """
+    :return: The static texts of the sheets in the current language, translated once by language
+    """
+    language = translation.get_language()
+    texts = _translated_texts.get(language)
+    if texts is None:
+        texts = {
+            'headers': ['''%s''' % _('registration_number'),
+                        '''%s''' % _('lastname'),
+                        '''%s''' % _('firstname'),
+                        '''%s''' % _('score'),
+                        '''%s''' % _('justification')],
+            'score_legend': "<br/>%s" % (str(_('score_legend') % "0 - 20")),
+            'authorized_decimal': "<br/><font color=red>%s</font>" % _('authorized_decimal_for_this_activity'),
+            'unauthorized_decimal': "<br/><font color=red>%s</font>" % _('unauthorized_decimal_for_this_activity'),
+            'regulation': '''<br/> %s : <a href="%s"><font color=blue><u>%s</u></font></a>'''
+                          % (_("in_accordance_to_regulation"), _("link_to_RGEE"), _("link_to_RGEE")),
+            'signature': '''
+                    <font size=10>%s ...................................... , </font>
+                    <font size=10>%s ..../..../.......... &nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;</font>
+                    <font size=10>%s</font>
+                   ''' % (_('done_at'), _('the'), _('signature')),
+        }
+        _translated_texts[language] = texts
+    return texts
 
 
 def add_header_footer(canvas, doc):
     """
     Add the page number
     """
-    styles = getSampleStyleSheet()
+    styles = get_styles()
     # Save the state of our canvas so we can draw on it
     canvas.saveState()
 
@@ -61,71 +158,228 @@ def add_header_footer(canvas, doc):
 
 
 def build_response(document):
+    """
+    Build the http response streaming the scores sheets pdf.
+    The pdf is written in a temporary file (kept in memory up to SPOOL_MAX_SIZE bytes),
+    or read from the cache (see pdf_cache), then sent by chunks instead of being copied in the response.
+    """
     filename = "%s.pdf" % _('scores_sheet')
-    response = HttpResponse(content_type='application/pdf')
+    pdf_file = _open_cached_pdf(document) if pdf_cache.is_enabled() else None
+    if pdf_file:
+        size = os.fstat(pdf_file.fileno()).st_size
+    else:
+        pdf_file = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+        _write_pdf(document, pdf_file)
+        size = pdf_file.tell()
+        pdf_file.seek(0)
+    response = StreamingHttpResponse(FileWrapper(pdf_file, CHUNK_SIZE), content_type='application/pdf')
     response['Content-Disposition'] = 'attachment; filename="%s"' % filename
-
-    pdf = build_pdf(document)
-    response.write(pdf)
+    response['Content-Length'] = size
     return response
 
 
-def build_pdf(document):
+def build_pdf(document, workers=None):
+    """
+    Render the scores sheets of a document.
+    :param document: The scores sheets data
+    :param workers: The number of processes (see write_pdf)
+    :return: The pdf (bytes)
+    """
     buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer,
+    write_pdf(document, buffer, workers)
+    pdf = buffer.getvalue()
+    buffer.close()
+    return pdf
+
+
+def write_pdf(document, output, workers=None, progress=None):
+    """
+    Render the scores sheets of a document in a file.
+    With more than one worker, each program of each learning unit year is rendered as an independent part
+    in a pool of processes, then the parts are concatenated.
+    If the cache is enabled, an unchanged document is not rendered again (see pdf_cache).
+    :param document: The scores sheets data
+    :param output: The binary file object in which the pdf is written
+    :param workers: The number of processes, settings.PAPER_SHEET_WORKERS by default (1 if not set)
+    :param progress: A function called with the percentage of the rendering done
+    """
+    pdf_file = _open_cached_pdf(document, workers, progress) if pdf_cache.is_enabled() else None
+    if pdf_file:
+        with pdf_file:
+            shutil.copyfileobj(pdf_file, output)
+    else:
+        _write_pdf(document, output, workers, progress)
+
+
+def _open_cached_pdf(document, workers=None, progress=None):
+    """
+    :return: The opened cached pdf of the document (rendered if it is not in the cache),
+    or None if it has been removed by the eviction of another process before being opened
+    """
+    try:
+        return open(_get_cached_pdf(document, workers, progress), 'rb')
+    except FileNotFoundError:
+        return None
+
+
+def _get_cached_pdf(document, workers=None, progress=None):
+    """
+    :return: The path of the cached pdf of the document, rendered if it is not in the cache
+    """
+    # The printing date is in the footer of the pages : a pdf rendered another day is rendered again
+    key = pdf_cache.get_key(dict(document, printing_date=_get_printing_date()), TEMPLATE_VERSION)
+    return pdf_cache.get_or_create(key, lambda output: _write_pdf(document, output, workers, progress))
+
+
+def _write_pdf(document, output, workers=None, progress=None):
+    if workers is None:
+        workers = getattr(settings, 'PAPER_SHEET_WORKERS', DEFAULT_WORKERS)
+    parts = _split_document(document)
+    if workers > 1 and len(parts) > 1:
+        _write_pdf_in_parallel(parts, workers, output, progress)
+    else:
+        _render_pdf(document, output, progress=progress)
+
+
+def _split_document(document):
+    """
+    Split a document in parts having one program of one learning unit year.
+    :return: A list of tuple (part document, estimated number of the first page of the part)
+    """
+    parts = []
+    first_page = 1
+    for learn_unit_year in document['learning_unit_years']:
+        for program in learn_unit_year['programs']:
+            part = dict(document, learning_unit_years=[dict(learn_unit_year, programs=[program])])
+            parts.append((part, first_page))
+            # A sheet (one page) is printed by STUDENTS_PER_PAGE enrollments
+            first_page += math.ceil(len(program['enrollments']) / STUDENTS_PER_PAGE)
+    return parts
+
+
+def _write_pdf_in_parallel(parts, workers, output, progress=None):
+    """
+    The progress is reported up to RENDER_PROGRESS for the rendering of the parts, up to RENDER_AGAIN_PROGRESS
+    for the parts rendered again, and 100 once the parts are merged.
+    """
+    language = translation.get_language()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_render_part, part, first_page, language) for part, first_page in parts]
+        if progress:
+            for done, future in enumerate(as_completed(futures), start=1):
+                progress(RENDER_PROGRESS * done // len(futures))
+        pdf_parts = [future.result() for future in futures]
+        # A part having more pages than estimated by _split_document shifts the numbers of the pages
+        # of the next parts : these parts are rendered again from their real first page
+        renumbered_parts = {}
+        first_page = 1
+        for index, ((part, estimated_first_page), pdf_part) in enumerate(zip(parts, pdf_parts)):
+            if not pdf_part:
+                continue
+            if first_page != estimated_first_page:
+                renumbered_parts[index] = executor.submit(_render_part, part, first_page, language)
+            first_page += _count_pages(pdf_part)
+        for done, (index, future) in enumerate(renumbered_parts.items(), start=1):
+            pdf_parts[index] = future.result()
+            if progress:
+                progress(RENDER_PROGRESS + (RENDER_AGAIN_PROGRESS - RENDER_PROGRESS) * done // len(renumbered_parts))
+    if progress:
+        progress(RENDER_AGAIN_PROGRESS)
+    merger = PdfFileMerger()
+    for pdf_part in pdf_parts:
+        if pdf_part:
+            merger.append(BytesIO(pdf_part))
+    merger.write(output)
+    merger.close()
+    if progress:
+        progress(100)
+
+
+def _count_pages(pdf):
+    return PdfFileReader(BytesIO(pdf)).getNumPages()
+
+
+def _render_part(part, first_page, language):
+    """
+    Render a part of a document in a process of the pool, in the language of the requester.
+    :return: The pdf of the part (bytes), None if the part has no page
+    """
+    if not part['learning_unit_years'][0]['programs'][0]['enrollments']:
+        return None
+    buffer = BytesIO()
+    with translation.override(language):
+        _render_pdf(part, buffer, first_page)
+    return buffer.getvalue()
+
+
+def _render_pdf(document, output, first_page=1, progress=None):
+    doc = SimpleDocTemplate(output,
                             pagesize=PAGE_SIZE,
                             rightMargin=MARGIN_SIZE,
                             leftMargin=MARGIN_SIZE,
                             topMargin=85,
                             bottomMargin=18)
-    styles = getSampleStyleSheet()
-    styles.add(ParagraphStyle(name='Justify', alignment=TA_JUSTIFY))
+    # The pages are numbered from first_page (the document can be a part of a bigger document)
+    doc.page_offset = first_page - 1
+    if progress:
+        doc.setProgressCallBack(_get_progress_callback(progress))
+    styles = get_styles()
     content = []
+    justifications = {}
     for learn_unit_year in document['learning_unit_years']:
         for program in learn_unit_year['programs']:
-            data = headers_table()
-            students_printed = 0
-            enrollments_to_print = len(program['enrollments'])
-            nb_students = len(program['enrollments'])
-            for enrollment in program['enrollments']:
-
-                # 1. Append the examEnrollment to the table 'data'
-                data.append([enrollment["registration_id"],
-                             Paragraph(enrollment["last_name"], styles['Normal']),
-                             Paragraph(enrollment["first_name"], styles['Normal']),
-                             enrollment["score"],
-                             Paragraph(_(enrollment["justification"]), styles['Normal'])])
-
-                students_printed += 1
-                enrollments_to_print -= 1
-
-                if students_printed == STUDENTS_PER_PAGE or enrollments_to_print == 0:
-                    students_printed = 0
-                    # Print a complete PDF sheet
-                    # 3. Write header
-                    main_data(learn_unit_year, program, nb_students, styles, content)
-                    # 4. Adding the complete table of examEnrollments to the PDF sheet
-                    _write_table_of_students(content, data)
-
-                    # 5. Write Legend
-                    deadline = program['deadline']
-                    end_page_infos_building(content, deadline)
-                    legend_building(learn_unit_year['decimal_scores'], document['justification_legend'], content)
-
-                    # 6. New Page
-                    content.append(PageBreak())
-
-                    # 7. New headers_table in variable 'data' with headers ('noma', 'firstname', 'lastname'...)
-                    #    in case there's one more page after this one
-                    data = headers_table()
+            enrollments = program['enrollments']
+            nb_students = len(enrollments)
+            # One complete PDF sheet by STUDENTS_PER_PAGE enrollments
+            for start in range(0, nb_students, STUDENTS_PER_PAGE):
+                # 1. New headers_table in variable 'data' with headers ('noma', 'firstname', 'lastname'...)
+                data = headers_table()
+                # 2. Append the examEnrollments of the page to the table 'data'
+                data.extend(_students_rows(enrollments[start:start + STUDENTS_PER_PAGE], styles, justifications))
+
+                # 3. Write header
+                main_data(learn_unit_year, program, nb_students, styles, content)
+                # 4. Adding the complete table of examEnrollments to the PDF sheet
+                _write_table_of_students(content, data)
+
+                # 5. Write Legend
+                deadline = program['deadline']
+                end_page_infos_building(content, deadline)
+                legend_building(learn_unit_year['decimal_scores'], document['justification_legend'], content)
+
+                # 6. New Page
+                content.append(PageBreak())
     doc.build(content, onFirstPage=add_header_footer, onLaterPages=add_header_footer)
-    pdf = buffer.getvalue()
-    buffer.close()
-    return pdf
+
+
+def _get_progress_callback(progress):
+    """
+    :return: A ReportLab progress callback calling progress with the percentage of the flowables drawn
+    """
+    size_estimate = [0]
+
+    def on_progress(progress_type, value):
+        if progress_type == 'SIZE_EST':
+            size_estimate[0] = value
+        elif progress_type == 'PROGRESS' and size_estimate[0]:
+            progress(min(100, 100 * value // size_estimate[0]))
+    return on_progress
 
 
 def header_building(canvas, doc, styles):
-    a = Image(settings.LOGO_INSTITUTION_URL, width=15*mm, height=20*mm)
+    """
+    Draw the header of a page. The header is the same on all the pages of a document : it is built once.
+    """
+    t_header = getattr(doc, 'page_header', None)
+    if t_header is None:
+        t_header = _build_header(styles)
+        doc.page_header = t_header
+    w, h = t_header.wrap(doc.width, doc.topMargin)
+    t_header.drawOn(canvas, doc.leftMargin, doc.height + doc.topMargin - h)
+
+
+def _build_header(styles):
+    a = Image(BytesIO(_get_logo(settings.LOGO_INSTITUTION_URL)), width=15*mm, height=20*mm)
 
     p = Paragraph('''<para align=center>
                         <font size=16>%s</font>
@@ -136,61 +390,81 @@ def header_building(canvas, doc, styles):
     t_header = Table(data_header, [30*mm, 100*mm, 50*mm])
 
     t_header.setStyle(TableStyle([]))
+    return t_header
 
-    w, h = t_header.wrap(doc.width, doc.topMargin)
-    t_header.drawOn(canvas, doc.leftMargin, doc.height + doc.topMargin - h)
+
+def _get_printing_date():
+    return datetime.datetime.now().strftime("%d/%m/%Y")
 
 
 def footer_building(canvas, doc, styles):
-    printing_date = datetime.datetime.now()
-    printing_date = printing_date.strftime("%d/%m/%Y")
-    pageinfo = "%s : %s" % (_('printing_date'), printing_date)
-    footer = Paragraph(''' <para align=right>Page %d - %s </para>''' % (doc.page, pageinfo), styles['Normal'])
+    pageinfo = getattr(doc, 'page_info', None)
+    if pageinfo is None:
+        pageinfo = "%s : %s" % (_('printing_date'), _get_printing_date())
+        doc.page_info = pageinfo
+    page = doc.page + getattr(doc, 'page_offset', 0)
+    footer = Paragraph(''' <para align=right>Page %d - %s </para>''' % (page, pageinfo), styles['Normal'])
     w, h = footer.wrap(doc.width, doc.bottomMargin)
     footer.drawOn(canvas, doc.leftMargin, h)
 
 
+def _students_rows(enrollments, styles, justifications):
+    """
+    Build the rows of the table of students.
+    The names fitting on one line are written as plain strings, the others are wrapped in a Paragraph.
+    The justifications (few distinct values) are translated and wrapped once by document.
+    :param justifications: The cache of the justification paragraphs of the document
+    """
+    rows = []
+    for enrollment in enrollments:
+        justification = enrollment["justification"]
+        if justification not in justifications:
+            justifications[justification] = _cell(_(justification), COLS_WIDTH[4], styles) if justification else ''
+        rows.append([enrollment["registration_id"],
+                     _cell(enrollment["last_name"], COLS_WIDTH[1], styles),
+                     _cell(enrollment["first_name"], COLS_WIDTH[2], styles),
+                     enrollment["score"],
+                     justifications[justification]])
+    return rows
+
+
+def _cell(text, col_width, styles):
+    """
+    :return: The text as a plain string if it fits on one line of the column, as a Paragraph else
+    """
+    text = '%s' % text
+    style = styles['Normal']
+    if '<' in text or '&' in text or \
+            stringWidth(text, style.fontName, style.fontSize) > col_width - 2 * CELL_PADDING:
+        return Paragraph(text, style)
+    return text
+
+
 def _write_table_of_students(content, data):
     t = Table(data, COLS_WIDTH, repeatRows=1)
-    t.setStyle(TableStyle([
-        ('INNERGRID', (0, 0), (-1, -1), 0.25, colors.black),
-        ('BOX', (0, 0), (-1, -1), 0.25, colors.black),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey)]))
+    t.setStyle(STUDENTS_TABLE_STYLE)
     content.append(t)
 
 
 def legend_building(decimal_scores, justification_legend, content):
-    p = ParagraphStyle('legend')
-    p.textColor = 'grey'
-    p.borderColor = 'grey'
-    p.borderWidth = 1
-    p.alignment = TA_CENTER
-    p.fontSize = 8
-    p.borderPadding = 5
-
+    texts = _get_translated_texts()
     legend_text = justification_legend
-    legend_text += "<br/>%s" % (str(_('score_legend') % "0 - 20"))
+    legend_text += texts['score_legend']
     if decimal_scores:
-        legend_text += "<br/><font color=red>%s</font>" % _('authorized_decimal_for_this_activity')
+        legend_text += texts['authorized_decimal']
     else:
-        legend_text += "<br/><font color=red>%s</font>" % _('unauthorized_decimal_for_this_activity')
+        legend_text += texts['unauthorized_decimal']
 
-    legend_text += '''<br/> %s : <a href="%s"><font color=blue><u>%s</u></font></a>''' \
-                   % (_("in_accordance_to_regulation"), _("link_to_RGEE"), _("link_to_RGEE"))
+    legend_text += texts['regulation']
     content.append(Paragraph('''
                             <para>
                                 %s
                             </para>
-                            ''' % legend_text, p))
+                            ''' % legend_text, LEGEND_STYLE))
 
 
 def headers_table():
-    data = [['''%s''' % _('registration_number'),
-             '''%s''' % _('lastname'),
-             '''%s''' % _('firstname'),
-             '''%s''' % _('score'),
-             '''%s''' % _('justification')]]
+    data = [list(_get_translated_texts()['headers'])]
     return data
 
 
@@ -221,11 +495,8 @@ def main_data(learning_unit_year, program, nb_students, styles, content):
         <para spaceb=20>
             &nbsp;
         </para>
-        ''', ParagraphStyle('normal')))
+        ''', NORMAL_STYLE))
 
-    text_left_style = ParagraphStyle('structure_header')
-    text_left_style.alignment = TA_LEFT
-    text_left_style.fontSize = 10
     struct_address = program['address']
     p_struct_name = Paragraph('%s' % struct_address.get('recipient') if struct_address.get('recipient') else '',
                               styles["Normal"])
@@ -260,26 +531,18 @@ def main_data(learning_unit_year, program, nb_students, styles, content):
 
     header_coordinator_structure = [[get_data_coordinator(learning_unit_year, styles), data_structure]]
     table_header = Table(header_coordinator_structure, colWidths='*')
-    table_header.setStyle(TableStyle([
-        ('LEFTPADDING', (0, 0), (-1, -1), 0),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 0),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP')
-    ]))
+    table_header.setStyle(HEADER_TABLE_STYLE)
 
     content.append(table_header)
 
-    p = ParagraphStyle('right_page_header')
-    p.alignment = TA_RIGHT
-    p.fontSize = 10
-
     deliberation_date = program['deliberation_date']
 
     content.append(Paragraph('%s : %s' % (_('deliberation_date'), deliberation_date), styles["Normal"]))
     content.append(Paragraph('%s : %s  - Session : %s' % (_('academic_year'),
                                                           learning_unit_year['academic_year'],
                                                           learning_unit_year['session_number']),
-                             text_left_style))
-    # content.append(Paragraph('Session : %d' % session_exam.number_session, text_left_style))
+                             TEXT_LEFT_STYLE))
+    # content.append(Paragraph('Session : %d' % session_exam.number_session, TEXT_LEFT_STYLE))
     content.append(Paragraph("<strong>%s : %s</strong>" % (learning_unit_year['acronym'], learning_unit_year['title']),
                              styles["Normal"]))
     content.append(Paragraph('''<b>%s : %s </b>(%s %s)''' % (_('program'),
@@ -291,32 +554,23 @@ def main_data(learning_unit_year, program, nb_students, styles, content):
         <para spaceb=2>
             &nbsp;
         </para>
-        ''', ParagraphStyle('normal')))
+        ''', NORMAL_STYLE))
 
 
 def end_page_infos_building(content, end_date):
-    p = ParagraphStyle('info')
-    p.fontSize = 10
-    p.alignment = TA_LEFT
     if not end_date:
         end_date = '(%s)' % _('date_not_passed')
     content.append(Paragraph(_("return_doc_to_administrator") % end_date
-                             , p))
+                             , INFO_STYLE))
     content.append(Paragraph('''
                             <para spaceb=5>
                                 &nbsp;
                             </para>
-                            ''', ParagraphStyle('normal')))
-    p_signature = ParagraphStyle('info')
-    p_signature.fontSize = 10
-    paragraph_signature = Paragraph('''
-                    <font size=10>%s ...................................... , </font>
-                    <font size=10>%s ..../..../.......... &nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;</font>
-                    <font size=10>%s</font>
-                   ''' % (_('done_at'), _('the'), _('signature')), p_signature)
+                            ''', NORMAL_STYLE))
+    paragraph_signature = Paragraph(_get_translated_texts()['signature'], SIGNATURE_STYLE)
     content.append(paragraph_signature)
     content.append(Paragraph('''
         <para spaceb=2>
             &nbsp;
         </para>
-        ''', ParagraphStyle('normal')))
+        ''', NORMAL_STYLE))
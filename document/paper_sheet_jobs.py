@@ -0,0 +1,156 @@
+##############################################################################
+#
+#    OSIS stands for Open Student Information System. It's an application
+#    designed to manage the core business of higher education institutions,
+#    such as universities, faculties, institutes and professional schools.
+#    The core business involves the administration of students, teachers,
+#    courses, programs and so on.
+#
+#    Copyright (C) 2015-2016 Université catholique de Louvain (http://www.uclouvain.be)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    A copy of this license - GNU General Public License - is available
+#    at the root of the source code of this program.  If not,
+#    see http://www.gnu.org/licenses/.
+#
+##############################################################################
+"""
+Rendering of the scores sheets in background.
+submit puts a rendering job in the paper sheet jobs queue and returns at once ; the workers started by
+start_workers render the pdf, store it as a DocumentFile and update the status and the progress of the job,
+which can be polled with get_status.
+The name of the queue is settings.QUEUES['QUEUES_NAME']['PAPER_SHEET_JOBS'] (the PAPER_SHEET queue is used
+by the ScoresSheetClient calls).
+"""
+import json
+import logging
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.utils import translation
+from django.utils.translation import ugettext as _
+
+from osis_common.document import paper_sheet
+from osis_common.models import document_file as document_file_mdl
+from osis_common.models import paper_sheet_job as paper_sheet_job_mdl
+from osis_common.models.paper_sheet_job import PaperSheetJob
+from osis_common.queue import queue_sender
+from osis_common.queue.queue_listener import SynchronousConsumerThread
+
+logger = logging.getLogger(settings.DEFAULT_LOGGER)
+
+DEFAULT_NB_WORKERS = 2
+# Number of days the rendered pdf are kept
+DEFAULT_STORAGE_DURATION = 1
+# The progress of a job is saved by steps of PROGRESS_STEP percents
+PROGRESS_STEP = 5
+
+
+def get_queue_name():
+    if hasattr(settings, 'QUEUES'):
+        return settings.QUEUES.get('QUEUES_NAME').get('PAPER_SHEET_JOBS')
+    return None
+
+
+def submit(document, requested_by='system'):
+    """
+    Create a job rendering the scores sheets of a document in background.
+    :param document: The scores sheets data (see paper_sheet.build_pdf)
+    :param requested_by: The user requesting the scores sheets
+    :return: The uuid of the job
+    """
+    job = PaperSheetJob.objects.create(requested_by=requested_by)
+    queue_sender.send_message(get_queue_name(), {'job_uuid': str(job.uuid),
+                                                 'language': translation.get_language(),
+                                                 'document': document})
+    return job.uuid
+
+
+def get_status(job_uuid):
+    """
+    :return: A dict with the status, the progress and the id of the DocumentFile of the job (None if not done),
+    None if the job does not exist
+    """
+    job = paper_sheet_job_mdl.find_by_uuid(job_uuid)
+    if not job:
+        return None
+    return {'status': job.status,
+            'progress': job.progress,
+            'document_file_id': job.document_file_id,
+            'error': job.error}
+
+
+def process_job(json_data):
+    """
+    Callback of the workers : render the scores sheets of a job and store them as a DocumentFile.
+    A job is rendered only once : a message redelivered by the queue server for a job no more pending is ignored.
+    The pdf is rendered in the worker thread (the workers already render the jobs in parallel) : a pool of processes
+    forked from the multithreaded process of the workers could deadlock.
+    """
+    data = json.loads(json_data.decode("utf-8"))
+    job = paper_sheet_job_mdl.find_by_uuid(data.get('job_uuid'))
+    if not job:
+        logger.warning('Paper sheet job {} does not exist'.format(data.get('job_uuid')))
+        return
+    if job.status != PaperSheetJob.PENDING:
+        logger.warning('Paper sheet job {} already {}'.format(job.uuid, job.status))
+        return
+    paper_sheet_job_mdl.update_job(job.uuid, status=PaperSheetJob.RUNNING, progress=0)
+    try:
+        with translation.override(data.get('language')), tempfile.TemporaryFile() as pdf_file:
+            paper_sheet.write_pdf(data.get('document'), pdf_file, workers=1,
+                                  progress=__get_progress_saver(job.uuid))
+            size = pdf_file.tell()
+            pdf_file.seek(0)
+            document_file = __save_document_file(job, pdf_file, size)
+    except Exception as e:
+        paper_sheet_job_mdl.update_job(job.uuid, status=PaperSheetJob.FAILED,
+                                       error='{}: {}'.format(type(e).__name__, e))
+        raise
+    paper_sheet_job_mdl.update_job(job.uuid, status=PaperSheetJob.DONE, progress=100, document_file=document_file)
+
+
+def __get_progress_saver(job_uuid):
+    saved_progress = [0]
+
+    def save_progress(progress):
+        if progress - saved_progress[0] >= PROGRESS_STEP:
+            paper_sheet_job_mdl.update_job(job_uuid, progress=progress)
+            saved_progress[0] = progress
+    return save_progress
+
+
+def __save_document_file(job, pdf_file, size):
+    file_name = '{}_{}.pdf'.format(_('scores_sheet'), job.uuid)
+    document_file = document_file_mdl.DocumentFile(
+        file_name=file_name,
+        content_type='application/pdf',
+        storage_duration=getattr(settings, 'PAPER_SHEET_JOBS_STORAGE_DURATION', DEFAULT_STORAGE_DURATION),
+        description='scores_sheet',
+        update_by=job.requested_by,
+        size=size)
+    document_file.file.save(file_name, File(pdf_file), save=False)
+    document_file.save()
+    return document_file
+
+
+def start_workers(nb_workers=None):
+    """
+    Start the workers rendering the jobs of the queue, each one in its own thread.
+    :param nb_workers: The number of workers, settings.PAPER_SHEET_JOBS_WORKERS by default (2 if not set)
+    """
+    nb_workers = nb_workers or getattr(settings, 'PAPER_SHEET_JOBS_WORKERS', DEFAULT_NB_WORKERS)
+    for index in range(nb_workers):
+        # A prefetch of one job shares the jobs between the workers ; the other jobs wait in the queue
+        SynchronousConsumerThread(get_queue_name(), process_job, prefetch_count=1,
+                                  name='PaperSheetWorker-{}'.format(index)).start()
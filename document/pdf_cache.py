@@ -0,0 +1,132 @@
+##############################################################################
+#
+#    OSIS stands for Open Student Information System. It's an application
+#    designed to manage the core business of higher education institutions,
+#    such as universities, faculties, institutes and professional schools.
+#    The core business involves the administration of students, teachers,
+#    courses, programs and so on.
+#
+#    Copyright (C) 2015-2016 Université catholique de Louvain (http://www.uclouvain.be)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    A copy of this license - GNU General Public License - is available
+#    at the root of the source code of this program.  If not,
+#    see http://www.gnu.org/licenses/.
+#
+##############################################################################
+"""
+Disk cache of the rendered scores sheets.
+A rendered pdf is stored in a file named by the hash of its content (the normalized document, the language
+and the version of the renderer) : a modified document is rendered again, an unchanged one is served from the disk.
+The cache is enabled by settings.PAPER_SHEET_CACHE_DIR. The files expire after
+settings.PAPER_SHEET_CACHE_STORAGE_DURATION days (default 1), and the least recently used files are removed
+when the size of the cache exceeds settings.PAPER_SHEET_CACHE_MAX_SIZE bytes (default 500 MB).
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+
+from django.conf import settings
+from django.utils import translation
+
+logger = logging.getLogger(settings.DEFAULT_LOGGER)
+
+DEFAULT_STORAGE_DURATION = 1
+DEFAULT_MAX_SIZE = 500 * 1024 * 1024
+FILE_EXTENSION = '.pdf'
+
+
+def is_enabled():
+    return bool(getattr(settings, 'PAPER_SHEET_CACHE_DIR', None))
+
+
+def get_key(document, version):
+    """
+    :param document: The data of the rendered file
+    :param version: The version of the renderer (a new version does not use the files rendered by the previous ones)
+    :return: The hash identifying the rendered file
+    """
+    normalized_document = json.dumps(document, sort_keys=True, separators=(',', ':'), default=str)
+    content = '{}\0{}\0{}'.format(version, translation.get_language(), normalized_document)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def get_or_create(key, write):
+    """
+    Get the path of a cached file, rendering it if it is not in the cache (or expired).
+    :param key: The key of the file (see get_key)
+    :param write: The function writing the file, taking a binary file object as argument
+    :return: The path of the cached file
+    """
+    cache_dir = settings.PAPER_SHEET_CACHE_DIR
+    path = os.path.join(cache_dir, key + FILE_EXTENSION)
+    if _is_valid(path):
+        # The access time is the last use of the file (for the LRU eviction)
+        os.utime(path, (time.time(), os.path.getmtime(path)))
+        return path
+    os.makedirs(cache_dir, exist_ok=True)
+    file_descriptor, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    try:
+        with os.fdopen(file_descriptor, 'wb') as output:
+            write(output)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+    evict(keep=path)
+    return path
+
+
+def evict(keep=None):
+    """
+    Remove the expired files, then the least recently used files until the cache fits in its maximum size.
+    :param keep: The path of a file not to remove (the file just rendered)
+    """
+    cache_dir = settings.PAPER_SHEET_CACHE_DIR
+    max_size = getattr(settings, 'PAPER_SHEET_CACHE_MAX_SIZE', DEFAULT_MAX_SIZE)
+    files = []
+    for file_name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, file_name)
+        if not file_name.endswith(FILE_EXTENSION) or path == keep:
+            continue
+        try:
+            if _is_valid(path):
+                stat = os.stat(path)
+                files.append((stat.st_atime, stat.st_size, path))
+            else:
+                os.remove(path)
+        except FileNotFoundError:
+            # Removed by another process
+            continue
+    total_size = sum(size for last_use, size, path in files)
+    if keep:
+        total_size += os.path.getsize(keep)
+    for last_use, size, path in sorted(files):
+        if total_size <= max_size:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total_size -= size
+        logger.debug('Scores sheet {} removed from the cache'.format(path))
+
+
+def _is_valid(path):
+    storage_duration = getattr(settings, 'PAPER_SHEET_CACHE_STORAGE_DURATION', DEFAULT_STORAGE_DURATION)
+    try:
+        return time.time() - os.path.getmtime(path) < storage_duration * 24 * 3600
+    except FileNotFoundError:
+        return False
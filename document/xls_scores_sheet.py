@@ -0,0 +1,136 @@
+##############################################################################
+#
+#    OSIS stands for Open Student Information System. It's an application
+#    designed to manage the core business of higher education institutions,
+#    such as universities, faculties, institutes and professional schools.
+#    The core business involves the administration of students, teachers,
+#    courses, programs and so on.
+#
+#    Copyright (C) 2015-2016 Université catholique de Louvain (http://www.uclouvain.be)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    A copy of this license - GNU General Public License - is available
+#    at the root of the source code of this program.  If not,
+#    see http://www.gnu.org/licenses/.
+#
+##############################################################################
+"""
+Excel export of the scores sheets, built from the same document as the pdf (see paper_sheet.build_pdf).
+The workbook has one worksheet by program of each learning unit year. It is written with the constant_memory
+mode of XlsxWriter : the rows are flushed to disk as they are written, so that the memory stays bounded
+for very large sessions. In this mode, a temporary file is kept open by worksheet until the workbook is closed :
+the number of worksheets is limited to settings.PAPER_SHEET_XLSX_MAX_SHEETS (default 500), so that the process
+does not run out of file descriptors.
+"""
+import re
+import tempfile
+from wsgiref.util import FileWrapper
+
+import xlsxwriter
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils.translation import ugettext as _
+
+from osis_common.document.paper_sheet import SPOOL_MAX_SIZE, CHUNK_SIZE
+
+CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+COLS_WIDTH = [15, 30, 25, 10, 20]
+SHEET_NAME_MAX_LENGTH = 31
+DEFAULT_MAX_SHEETS = 500
+# Characters not allowed in a worksheet name
+SHEET_NAME_FORBIDDEN_CHARS = re.compile(r'[\[\]:*?/\\]')
+
+
+def build_response(document):
+    """
+    Build the http response streaming the scores sheets workbook.
+    """
+    filename = "%s.xlsx" % _('scores_sheet')
+    xlsx_file = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    write_xlsx(document, xlsx_file)
+    size = xlsx_file.tell()
+    xlsx_file.seek(0)
+    response = StreamingHttpResponse(FileWrapper(xlsx_file, CHUNK_SIZE), content_type=CONTENT_TYPE)
+    response['Content-Disposition'] = 'attachment; filename="%s"' % filename
+    response['Content-Length'] = size
+    return response
+
+
+def write_xlsx(document, output):
+    """
+    Write the scores sheets of a document in a workbook.
+    :param document: The scores sheets data
+    :param output: The binary file object in which the workbook is written
+    :raise ValueError: If the document has more programs than the maximum number of worksheets
+    """
+    max_sheets = getattr(settings, 'PAPER_SHEET_XLSX_MAX_SHEETS', DEFAULT_MAX_SHEETS)
+    nb_sheets = sum(len(learn_unit_year['programs']) for learn_unit_year in document['learning_unit_years'])
+    if nb_sheets > max_sheets:
+        raise ValueError('{} worksheets requested, the maximum is {}'.format(nb_sheets, max_sheets))
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
+    bold = workbook.add_format({'bold': True})
+    headers = [_('registration_number'), _('lastname'), _('firstname'), _('score'), _('justification')]
+    justifications = {}
+    sheet_names = set()
+    for learn_unit_year in document['learning_unit_years']:
+        for program in learn_unit_year['programs']:
+            worksheet = workbook.add_worksheet(_get_sheet_name(learn_unit_year, program, sheet_names))
+            for column, width in enumerate(COLS_WIDTH):
+                worksheet.set_column(column, column, width)
+            row = _write_infos(worksheet, learn_unit_year, program, bold)
+            worksheet.write_row(row, 0, headers, bold)
+            for enrollment in program['enrollments']:
+                row += 1
+                justification = enrollment["justification"]
+                if justification not in justifications:
+                    justifications[justification] = _(justification) if justification else ''
+                worksheet.write_row(row, 0, [enrollment["registration_id"],
+                                             enrollment["last_name"],
+                                             enrollment["first_name"],
+                                             enrollment["score"],
+                                             justifications[justification]])
+    workbook.close()
+
+
+def _write_infos(worksheet, learn_unit_year, program, bold):
+    """
+    Write the information of the learning unit year and of the program above the table of students.
+    :return: The row of the header of the table of students
+    """
+    deadline = program['deadline'] or '(%s)' % _('date_not_passed')
+    infos = [("%s : %s" % (learn_unit_year['acronym'], learn_unit_year['title']), bold),
+             ('%s : %s (%s %s)' % (_('program'), program['acronym'], len(program['enrollments']), _('students')),
+              bold),
+             ('%s : %s  - Session : %s' % (_('academic_year'), learn_unit_year['academic_year'],
+                                           learn_unit_year['session_number']), None),
+             ('%s : %s' % (_('deliberation_date'), program['deliberation_date']), None),
+             (_("return_doc_to_administrator") % deadline, None)]
+    for row, (info, cell_format) in enumerate(infos):
+        worksheet.write_string(row, 0, info, cell_format)
+    # A blank row between the information and the table of students
+    return len(infos) + 1
+
+
+def _get_sheet_name(learn_unit_year, program, sheet_names):
+    """
+    :return: A valid worksheet name (unique in the workbook) for a program of a learning unit year
+    """
+    name = SHEET_NAME_FORBIDDEN_CHARS.sub('-', '%s %s' % (learn_unit_year['acronym'], program['acronym']))
+    name = name[:SHEET_NAME_MAX_LENGTH]
+    index = 1
+    unique_name = name
+    while unique_name.lower() in sheet_names:
+        index += 1
+        suffix = ' (%d)' % index
+        unique_name = name[:SHEET_NAME_MAX_LENGTH - len(suffix)] + suffix
+    sheet_names.add(unique_name.lower())
+    return unique_name
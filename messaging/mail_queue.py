@@ -0,0 +1,279 @@
+##############################################################################
+#
+#    OSIS stands for Open Student Information System. It's an application
+#    designed to manage the core business of higher education institutions,
+#    such as universities, faculties, institutes and professional schools.
+#    The core business involves the administration of students, teachers,
+#    courses, programs and so on.
+#
+#    Copyright (C) 2015-2016 Université catholique de Louvain (http://www.uclouvain.be)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    A copy of this license - GNU General Public License - is available
+#    at the root of the source code of this program.  If not,
+#    see http://www.gnu.org/licenses/.
+#
+##############################################################################
+"""
+Asynchronous sending of the emails through the queue.
+The sending functions of send_message render the messages and save them in history as usual,
+but a QueueMailSender puts the emails in the mails queue instead of sending them :
+
+    with mail_queue.QueueMailSender() as sender:
+        send_message.send_messages(message_content, mail_sender=sender)
+
+The workers started by start_workers consume the mails queue, send the emails over their own connection
+to the mail server and set the 'sent' date of the message histories. An email which cannot be sent
+is put back in the queue, up to settings.EMAIL_QUEUE_MAX_ATTEMPTS times (default 5). The retries are delayed
+by the queue server : the email waits in a delay queue (the mails queue name suffixed by '_retry_' and the delay)
+whose messages expire after the delay and are then dead-lettered back to the mails queue.
+When the rate limits are reached (see rate_limiter), a worker waits a little for the limiter, then puts the email
+back at the end of the queue (deferred) so that the emails to other domains are not blocked.
+The name of the mails queue is settings.QUEUES['QUEUES_NAME']['MAILS'].
+"""
+import base64
+import json
+import logging
+import smtplib
+import threading
+
+import pika
+from pika.exceptions import AMQPError, ConnectionClosed
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives
+from django.utils import timezone
+
+from osis_common.messaging import rate_limiter as rate_limiter_mdl
+from osis_common.messaging.mail_sender import MailSender, DEFAULT_BATCH_SIZE
+from osis_common.models import message_history as message_history_mdl
+from osis_common.queue import queue_sender
+from osis_common.queue.queue_listener import SynchronousConsumerThread
+
+logger = logging.getLogger(settings.DEFAULT_LOGGER)
+
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_NB_WORKERS = 4
+# Delay before the retry of an email, in seconds : 2 ** attempts, up to MAX_RETRY_DELAY
+MAX_RETRY_DELAY = 60
+
+_worker_data = threading.local()
+
+
+def get_queue_name():
+    if hasattr(settings, 'QUEUES'):
+        return settings.QUEUES.get('QUEUES_NAME').get('MAILS')
+    return None
+
+
+class QueueMailSender(object):
+    """
+    Mail sender putting the emails in the mails queue (same interface as mail_sender.MailSender).
+    Used as a context manager, the connection to the queue server is opened once for all the emails ;
+    ConnectionClosed is raised if the queue server is not available.
+    """
+    asynchronous = True
+
+    def __init__(self, batch_size=None):
+        self.batch_size = batch_size or getattr(settings, 'EMAIL_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+        self.queue_name = get_queue_name()
+        self.connection = None
+        self.channel = None
+
+    def __enter__(self):
+        self.connection = queue_sender.get_connection()
+        self.channel = queue_sender.get_channel(self.connection, self.queue_name)
+        if not self.channel:
+            # The emails would be lost, and their message histories never set as sent
+            raise ConnectionClosed()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.channel and not self.channel.is_closed:
+            self.channel.close()
+        if self.connection and not self.connection.is_closed:
+            self.connection.close()
+
+    def send(self, emails, message_histories=None):
+        """
+        Put the emails in the mails queue.
+        :param emails: A list of django EmailMultiAlternatives
+        :param message_histories: For each email, the list of the saved MessageHistory of the receivers
+        it is addressed to
+        :return: The number of emails put in the queue
+        """
+        for index, email in enumerate(emails):
+            histories = message_histories[index] if message_histories else []
+            queue_sender.send_message(self.queue_name, serialize_email(email, histories),
+                                      connection=self.connection, channel=self.channel)
+        rate_limiter = rate_limiter_mdl.get_rate_limiter()
+        if rate_limiter:
+            rate_limiter.count('queued', len(emails))
+        return len(emails)
+
+
+def serialize_email(email, message_histories, attempts=0):
+    """
+    :return: A JSON serializable dict representing the email and the ids of the message histories
+    to update once sent
+    """
+    return {
+        'subject': email.subject,
+        'body': email.body,
+        'from_email': email.from_email,
+        'to': email.to,
+        'alternatives': email.alternatives,
+        'attachments': [__serialize_attachment(attachment) for attachment in email.attachments],
+        'histories': [message_history.id for message_history in message_histories],
+        'attempts': attempts,
+    }
+
+
+def __serialize_attachment(attachment):
+    name, content, mimetype = attachment
+    if isinstance(content, bytes):
+        return [name, base64.b64encode(content).decode('ascii'), mimetype, True]
+    return [name, content, mimetype, False]
+
+
+def deserialize_email(data):
+    attachments = [(name, base64.b64decode(content) if encoded else content, mimetype)
+                   for name, content, mimetype, encoded in data.get('attachments')]
+    email = EmailMultiAlternatives(data.get('subject'), data.get('body'), data.get('from_email'), data.get('to'),
+                                   attachments=attachments)
+    for content, mimetype in data.get('alternatives'):
+        email.attach_alternative(content, mimetype)
+    return email
+
+
+def process_message(json_data):
+    """
+    Callback of the workers : send an email of the mails queue and set the sent date of its message histories.
+    """
+    data = json.loads(json_data.decode("utf-8"))
+    email = deserialize_email(data)
+    rate_limiter = rate_limiter_mdl.get_rate_limiter()
+    if rate_limiter and not rate_limiter.acquire(email.recipients(), timeout=rate_limiter_mdl.get_defer_timeout()):
+        rate_limiter.count('deferred')
+        __publish(data)
+        return
+    try:
+        if rate_limiter:
+            with rate_limiter.sending():
+                sent = __get_worker_mail_sender().send([email])
+            rate_limiter.count('sent', sent)
+        else:
+            sent = __get_worker_mail_sender().send([email])
+    except (smtplib.SMTPException, OSError):
+        __retry_later(data)
+        return
+    # An email without recipients is not sent by the email backend
+    if sent:
+        __set_sent(data.get('histories'))
+
+
+def __get_worker_mail_sender():
+    """
+    Each worker thread keeps its own connection to the mail server open.
+    """
+    if not hasattr(_worker_data, 'mail_sender'):
+        # The rate limitation is done by the worker itself, in order to defer the emails
+        _worker_data.mail_sender = MailSender(rate_limited=False)
+        _worker_data.mail_sender.connection.open()
+    return _worker_data.mail_sender
+
+
+def __retry_later(data):
+    attempts = data.get('attempts', 0) + 1
+    if attempts >= getattr(settings, 'EMAIL_QUEUE_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS):
+        logger.exception('Email "{}" to {} not sent after {} attempts'.format(data.get('subject'), data.get('to'),
+                                                                              attempts))
+        return
+    logger.warning('Email "{}" not sent, retry {}'.format(data.get('subject'), attempts))
+    data['attempts'] = attempts
+    # Back off before the retry, so that a down mail server is not hammered. The worker is not blocked :
+    # the email waits in a delay queue of the queue server.
+    __publish(data, delay=min(2 ** attempts, MAX_RETRY_DELAY))
+
+
+def __publish(data, delay=None):
+    """
+    Put an email back in the mails queue, through a delay queue if a delay (in seconds) is given.
+    The connection of the worker to the queue server is reopened once if it has been lost.
+    """
+    for attempt in range(2):
+        try:
+            channel = __get_worker_channel()
+            routing_key = __declare_delay_queue(channel, delay) if delay else get_queue_name()
+            channel.basic_publish(exchange='',
+                                  routing_key=routing_key,
+                                  body=json.dumps(data),
+                                  properties=pika.BasicProperties(content_type='application/json',
+                                                                  delivery_mode=2))
+            return
+        except AMQPError:
+            __close_worker_channel()
+            if attempt:
+                raise
+
+
+def __get_worker_channel():
+    """
+    Each worker thread keeps its own connection to the queue server open to put the emails back.
+    """
+    channel = getattr(_worker_data, 'channel', None)
+    if channel is None or channel.is_closed:
+        __close_worker_channel()
+        _worker_data.connection = queue_sender.get_connection()
+        _worker_data.channel = queue_sender.get_channel(_worker_data.connection, get_queue_name())
+        _worker_data.delay_queues = set()
+    return _worker_data.channel
+
+
+def __close_worker_channel():
+    connection = getattr(_worker_data, 'connection', None)
+    _worker_data.connection = None
+    _worker_data.channel = None
+    if connection and not connection.is_closed:
+        try:
+            connection.close()
+        except AMQPError:
+            pass
+
+
+def __declare_delay_queue(channel, delay):
+    queue_name = get_queue_name()
+    delay_queue_name = '{}_retry_{}'.format(queue_name, delay)
+    if delay_queue_name not in _worker_data.delay_queues:
+        channel.queue_declare(queue=delay_queue_name, durable=True,
+                              arguments={'x-message-ttl': delay * 1000,
+                                         'x-dead-letter-exchange': '',
+                                         'x-dead-letter-routing-key': queue_name})
+        _worker_data.delay_queues.add(delay_queue_name)
+    return delay_queue_name
+
+
+def __set_sent(message_histories_ids):
+    if message_histories_ids:
+        message_history_mdl.MessageHistory.objects.filter(id__in=message_histories_ids,
+                                                          sent__isnull=True).update(sent=timezone.now())
+
+
+def start_workers(nb_workers=None):
+    """
+    Start the workers sending the emails of the mails queue, each one in its own thread.
+    :param nb_workers: The number of workers, settings.EMAIL_QUEUE_WORKERS by default (4 if not set)
+    """
+    nb_workers = nb_workers or getattr(settings, 'EMAIL_QUEUE_WORKERS', DEFAULT_NB_WORKERS)
+    for index in range(nb_workers):
+        # A prefetch of one message shares the messages between the workers
+        SynchronousConsumerThread(get_queue_name(), process_message, prefetch_count=1,
+                                  name='MailWorker-{}'.format(index)).start()
@@ -0,0 +1,126 @@
+##############################################################################
+#
+#    OSIS stands for Open Student Information System. It's an application
+#    designed to manage the core business of higher education institutions,
+#    such as universities, faculties, institutes and professional schools.
+#    The core business involves the administration of students, teachers,
+#    courses, programs and so on.
+#
+#    Copyright (C) 2015-2016 Université catholique de Louvain (http://www.uclouvain.be)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    A copy of this license - GNU General Public License - is available
+#    at the root of the source code of this program.  If not,
+#    see http://www.gnu.org/licenses/.
+#
+##############################################################################
+"""
+Connection to the mail server shared by all the sendings of a run.
+Opening a connection (with the TLS handshake) costs much more than sending a message over it,
+so a run of sendings opens it once :
+
+    with mail_sender.MailSender() as sender:
+        send_message.send_messages(message_content_1, mail_sender=sender)
+        send_message.send_messages(message_content_2, mail_sender=sender)
+"""
+import logging
+import smtplib
+import socket
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.mail import get_connection
+
+from osis_common.messaging import rate_limiter as rate_limiter_mdl
+
+logger = logging.getLogger(settings.DEFAULT_LOGGER)
+
+DEFAULT_BATCH_SIZE = 100
+# Errors of the connection to the mail server. The SMTP errors are OSError too, they must not be caught with them.
+CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, socket.timeout)
+
+
+class MailSender(object):
+    """
+    Send emails by batches over one connection of the email backend, reconnecting once if the connection is lost.
+    The size of the batches is settings.EMAIL_BATCH_SIZE (default 100).
+    The sending is throttled by the rate limiter of the process (see rate_limiter), unless rate_limited is False.
+    """
+    # The emails are sent when send() returns (see mail_queue.QueueMailSender)
+    asynchronous = False
+
+    def __init__(self, batch_size=None, connection=None, rate_limited=True):
+        self.batch_size = batch_size or getattr(settings, 'EMAIL_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+        self.connection = connection or get_connection()
+        self.rate_limiter = rate_limiter_mdl.get_rate_limiter() if rate_limited else None
+
+    def __enter__(self):
+        self.connection.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.connection.close()
+
+    def send(self, emails, message_histories=None):
+        """
+        Send a list of emails.
+        :param emails: A list of django EmailMessage
+        :param message_histories: For each email, the list of the saved MessageHistory of the receivers it is addressed
+        to (used by asynchronous senders)
+        :return: The number of emails sent
+        """
+        sent = 0
+        for start in range(0, len(emails), self.batch_size):
+            sent += self._send_batch(emails[start:start + self.batch_size])
+        return sent
+
+    def _send_batch(self, emails):
+        if not self.rate_limiter:
+            return self._send_over_connection(emails)
+        for email in emails:
+            self.rate_limiter.acquire(email.recipients())
+        with self.rate_limiter.sending():
+            sent = self._send_over_connection(emails)
+        self.rate_limiter.count('sent', sent)
+        return sent
+
+    def _send_over_connection(self, emails):
+        """
+        Send the emails one by one over the connection, so that after a connection loss only the emails
+        not sent yet are sent again. The other errors (refused recipients...) are not retried.
+        """
+        sent = 0
+        reconnected = False
+        for email in emails:
+            try:
+                sent += self.connection.send_messages([email]) or 0
+            except CONNECTION_ERRORS:
+                if reconnected:
+                    raise
+                logger.warning('Connection to the mail server lost, reconnecting')
+                reconnected = True
+                self.connection.close()
+                self.connection.open()
+                sent += self.connection.send_messages([email]) or 0
+        return sent
+
+
+@contextmanager
+def use_mail_sender(mail_sender=None):
+    """
+    Use the mail sender of the run if given, or a new one for this sending only.
+    """
+    if mail_sender:
+        yield mail_sender
+    else:
+        with MailSender() as new_mail_sender:
+            yield new_mail_sender
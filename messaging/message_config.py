@@ -76,7 +76,9 @@ def create_table(table_template_name, header_txt, data):
     Create à dict that represent the table of data hat has to be inserted in a message template.
     :param table_template_name:The name of the param in the template used to represent the table.
     :param header_txt: The header of the table, as a list of strings
-    :param data: The data for each row of the table as list of tuples
+    :param data: The data for each row of the table as list of tuples.
+    It can also be any iterable of tuples (a generator for example), which is read only once.
+    A table with too many rows is not inserted in the message but attached to it as a csv file.
     :return: The dict representing the table used in the formating of the message
     """
     return {
@@ -86,16 +88,19 @@ def create_table(table_template_name, header_txt, data):
     }
 
 
-def create_receiver(receiver_id, receiver_email, receiver_lang):
+def create_receiver(receiver_id, receiver_email, receiver_lang, template_data=None):
     """
     Create a receiver dict used by the sending message function.
     :param receiver_id: The id of the receiver (usually person.id)
     :param receiver_email: The eail of the receiver.
     :param receiver_lang: The language of the receiver
+    :param template_data: The data used by the template for this receiver only.
+    It is only used by the send_personalized_messages function, and overrides the template_base_data.
     :return: The dict representing the receiver of a message
     """
     return {
         'receiver_id':      receiver_id,
         'receiver_email':   receiver_email,
-        'receiver_lang':    receiver_lang
+        'receiver_lang':    receiver_lang,
+        'template_data':    template_data,
     }
@@ -0,0 +1,192 @@
+##############################################################################
+#
+#    OSIS stands for Open Student Information System. It's an application
+#    designed to manage the core business of higher education institutions,
+#    such as universities, faculties, institutes and professional schools.
+#    The core business involves the administration of students, teachers,
+#    courses, programs and so on.
+#
+#    Copyright (C) 2015-2016 Université catholique de Louvain (http://www.uclouvain.be)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    A copy of this license - GNU General Public License - is available
+#    at the root of the source code of this program.  If not,
+#    see http://www.gnu.org/licenses/.
+#
+##############################################################################
+"""
+Rate limitation of the emails sending, so that the mail relay does not throttle or reject our bursts.
+The limits are configured in settings :
+    EMAIL_RATE_LIMITS = {
+        'RATE': 20,             # Emails per second, all domains together
+        'BURST': 100,           # Emails which can be sent at once after an idle period
+        'DOMAIN_RATE': 5,       # Emails per second to a same recipient domain
+        'DOMAIN_BURST': 20,
+        'MAX_CONCURRENCY': 4,   # Emails being sent at the same time in the process
+        'DEFER_TIMEOUT': 5,     # Seconds a mail worker waits for a token before deferring an email
+    }
+Without EMAIL_RATE_LIMITS, the sending is not limited.
+"""
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+
+_rate_limiter = None
+# The settings from which the rate limiter has been built
+_rate_limiter_limits = None
+_rate_limiter_lock = threading.Lock()
+
+
+class TokenBucket(object):
+    """
+    A bucket of 'capacity' tokens, refilled at 'rate' tokens per second. Thread-safe.
+    """
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def try_acquire(self, tokens=1):
+        """
+        Take tokens from the bucket if there are enough.
+        A request of more tokens than the capacity is granted when the bucket is full, and all the tokens are charged :
+        the bucket goes into debt, and the next requests wait until the debt is refilled.
+        :return: 0 if the tokens are taken, else the number of seconds to wait before there are enough tokens
+        """
+        needed = min(tokens, self.capacity)
+        with self.lock:
+            self._refill()
+            if self.tokens >= needed:
+                self.tokens -= tokens
+                return 0
+            return (needed - self.tokens) / self.rate
+
+    def release(self, tokens=1):
+        with self.lock:
+            self.tokens = min(self.capacity, self.tokens + tokens)
+
+
+class RateLimiter(object):
+    """
+    Global and per recipient domain token buckets, with a cap on the number of emails sent concurrently.
+    Also counts the queued, sent and deferred emails.
+    """
+    def __init__(self, rate, burst, domain_rate, domain_burst, max_concurrency):
+        self.bucket = TokenBucket(rate, burst)
+        self.domain_rate = domain_rate
+        self.domain_burst = domain_burst
+        self.domain_buckets = {}
+        self.domain_buckets_lock = threading.Lock()
+        self.concurrency = threading.BoundedSemaphore(max_concurrency)
+        self.metrics = Counter()
+        self.metrics_lock = threading.Lock()
+
+    def _get_domain_bucket(self, domain):
+        with self.domain_buckets_lock:
+            if domain not in self.domain_buckets:
+                self.domain_buckets[domain] = TokenBucket(self.domain_rate, self.domain_burst)
+            return self.domain_buckets[domain]
+
+    def try_acquire(self, recipients):
+        """
+        Take the tokens needed to send an email to the recipients, only if all the buckets have enough tokens.
+        :return: 0 if the tokens are taken, else the number of seconds to wait before retrying
+        """
+        taken = []
+        for domain, count in Counter(get_domain(recipient) for recipient in recipients).items():
+            bucket = self._get_domain_bucket(domain)
+            wait = bucket.try_acquire(count)
+            if wait:
+                break
+            taken.append((bucket, count))
+        else:
+            wait = self.bucket.try_acquire(len(recipients))
+            if not wait:
+                return 0
+        for bucket, count in taken:
+            bucket.release(count)
+        return wait
+
+    def acquire(self, recipients, timeout=None):
+        """
+        Wait until the email to the recipients can be sent.
+        :param timeout: The maximum number of seconds to wait, None to wait as long as needed
+        :return: True if the email can be sent, False if the timeout expired
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            wait = self.try_acquire(recipients)
+            if not wait:
+                return True
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+    @contextmanager
+    def sending(self):
+        """
+        Limit the number of emails being sent at the same time.
+        """
+        with self.concurrency:
+            yield
+
+    def count(self, metric, value=1):
+        with self.metrics_lock:
+            self.metrics[metric] += value
+
+    def get_metrics(self):
+        """
+        :return: A dict with the number of 'queued', 'sent' and 'deferred' emails since the start of the process
+        """
+        with self.metrics_lock:
+            return {metric: self.metrics[metric] for metric in ('queued', 'sent', 'deferred')}
+
+
+def get_domain(email_address):
+    return email_address.rpartition('@')[2].lower()
+
+
+def get_rate_limiter():
+    """
+    :return: The rate limiter of the process, None if settings.EMAIL_RATE_LIMITS is not set.
+    The rate limiter is built again when settings.EMAIL_RATE_LIMITS changes.
+    """
+    global _rate_limiter, _rate_limiter_limits
+    limits = getattr(settings, 'EMAIL_RATE_LIMITS', None)
+    if not limits:
+        return None
+    with _rate_limiter_lock:
+        if _rate_limiter is None or limits != _rate_limiter_limits:
+            _rate_limiter_limits = dict(limits)
+            _rate_limiter = RateLimiter(rate=limits.get('RATE'),
+                                        burst=limits.get('BURST', limits.get('RATE')),
+                                        domain_rate=limits.get('DOMAIN_RATE', limits.get('RATE')),
+                                        domain_burst=limits.get('DOMAIN_BURST', limits.get('BURST', limits.get('RATE'))),
+                                        max_concurrency=limits.get('MAX_CONCURRENCY', 1))
+        return _rate_limiter
+
+
+def get_defer_timeout():
+    return getattr(settings, 'EMAIL_RATE_LIMITS', {}).get('DEFER_TIMEOUT', 5)
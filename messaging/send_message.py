@@ -30,14 +30,16 @@ Utility files for message sending
 from html import unescape
 
 from django.core.mail import send_mail, EmailMultiAlternatives
-from django.template import Template, Context
+from django.template import Context
 from django.template.loader import render_to_string
 from django.utils import timezone
-from django.utils.html import strip_tags
+from django.utils.html import strip_tags, format_html
 
 from django.conf import settings
 from osis_common.models import message_history as message_history_mdl
-from osis_common.models import message_template as message_template_mdl
+from osis_common.messaging import template_cache
+from osis_common.messaging import table_renderer
+from osis_common.messaging import mail_sender as mail_sender_mdl
 from django.utils.translation import ugettext as _
 from django.utils import translation
 
@@ -45,16 +47,19 @@ import logging
 
 logger = logging.getLogger(settings.DEFAULT_LOGGER)
 
+# Rendered html signature, by logos urls
+_rendered_signatures = {}
+
 
 def _get_all_lang_templates(templates_refs):
     """
     Get all the templates, for all languages, according to the list of template reference.
     :param templates_refs: The list of templates references we want to retrieve
-    :return: A tuple of dictionnary with language as key and template as value.
-    The tuple length and items depends on the list of references.
+    :return: A list of dictionnary with language as key and template as value.
+    The list length and items depends on the list of references.
+    The templates are served by the registry of template_cache (no query if they are already loaded).
     """
-    return ({template.language: template for template in
-             list(message_template_mdl.find_by_reference(template_ref))} for template_ref in templates_refs)
+    return template_cache.get_templates_by_language(templates_refs)
 
 
 def _get_template_by_language_or_default(lang_code, html_message_templates, txt_message_templates):
@@ -77,7 +82,8 @@ def _get_template_by_language_or_default(lang_code, html_message_templates, txt_
     return html_message_template, txt_message_template
 
 
-def __send_messages(html_message_template, txt_message_template, html_data, txt_data, receivers, subject, attachment):
+def __send_messages(html_message_template, txt_message_template, html_data, txt_data, receivers, subject, attachments,
+                    mail_sender):
     """
     Send a message to a list of person ,with txt and html format.
     The messages are build according templates and data (dictionnary of template vars).
@@ -88,38 +94,32 @@ def __send_messages(html_message_template, txt_message_template, html_data, txt_
     :param txt_data: the data for the txt template
     :param receivers: The receivers list of the message
     :param subject: The subject of the message
-    :param attachment: An attachment to the message.
+    :param attachments: The attachments of the message.
+    :param mail_sender: The MailSender used to send the message.
     """
-    html_data['signature'] = render_to_string('messaging/html_email_signature.html', {
-        'logo_mail_signature_url': settings.LOGO_EMAIL_SIGNATURE_URL,
-        'logo_osis_url': settings.LOGO_OSIS_URL})
-    html_message = Template(html_message_template.template).render(Context(html_data))
-    txt_message = Template(txt_message_template.template).render(Context(txt_data))
+    html_data['signature'] = __get_signature()
+    html_message = template_cache.get_compiled_template(html_message_template).render(Context(html_data))
+    txt_message = template_cache.get_compiled_template(txt_message_template).render(Context(txt_data))
     __send_and_save(receivers=receivers,
                     subject=unescape(strip_tags(subject)),
                     message=unescape(strip_tags(txt_message)),
                     html_message=html_message, from_email=settings.DEFAULT_FROM_EMAIL,
-                    attachment=attachment)
+                    attachments=attachments,
+                    mail_sender=mail_sender)
 
 
-def __render_table_template_as_string(table_headers, table_rows, html_format):
+def __get_signature():
     """
-     Render the table template as a string.
-     If htmlformat is True , render the html table template , else the txt table template
-     Used to create dynamically a table of data to insert into email template.
-     :param table_headers: The header of the table as a list of Strings
-     :param table_rows: The content of each row as a list of item list
-     :param html_format True if you want the html template , False if you want the txt template
+    Get the html signature of the messages, rendered once by process.
     """
-    if html_format:
-        template = 'messaging/html_email_table_template.html'
-    else:
-        template = 'messaging/txt_email_table_template.html'
-    data = {
-        'table_headers': table_headers,
-        'table_rows': table_rows
-    }
-    return render_to_string(template, data)
+    key = (settings.LOGO_EMAIL_SIGNATURE_URL, settings.LOGO_OSIS_URL)
+    signature = _rendered_signatures.get(key)
+    if signature is None:
+        signature = render_to_string('messaging/html_email_signature.html', {
+            'logo_mail_signature_url': settings.LOGO_EMAIL_SIGNATURE_URL,
+            'logo_osis_url': settings.LOGO_OSIS_URL})
+        _rendered_signatures[key] = signature
+    return signature
 
 
 def __map_receivers_by_languages(receivers):
@@ -137,100 +137,176 @@ def __map_receivers_by_languages(receivers):
     return lang_dict
 
 
-def send_again(receiver, message_history_id):
+def send_again(receiver, message_history_id, mail_sender=None):
     """
     send a message from message history again
     :param receiver receiver of the message
     :param message_history_id The id of the message history to send again
+    :param mail_sender The MailSender of the run, if the message is sent as part of a run
     :return the sent message
     """
     message_history = message_history_mdl.find_by_id(message_history_id)
-    __send_and_save(receivers=(receiver, ),
-                    reference=message_history.reference,
-                    subject=message_history.subject,
-                    message=message_history.content_txt,
-                    html_message=message_history.content_html,
-                    from_email=settings.DEFAULT_FROM_EMAIL)
+    with mail_sender_mdl.use_mail_sender(mail_sender) as sender:
+        __send_and_save(receivers=(receiver, ),
+                        reference=message_history.reference,
+                        subject=message_history.subject,
+                        message=message_history.get_content_txt(),
+                        html_message=message_history.get_content_html(),
+                        from_email=settings.DEFAULT_FROM_EMAIL,
+                        mail_sender=sender)
     return message_history
 
 
-def __send_and_save(receivers, reference=None, **kwargs):
+def send_again_many(resends, mail_sender=None):
+    """
+    Send many messages from message history again.
+    The message histories are loaded at once, the messages are sent by batches over the connection
+    of the mail sender and the new message histories are inserted in bulk.
+    :param resends: A list of tuple (receiver, message_history_id)
+    :param mail_sender: The MailSender of the run, if the messages are sent as part of a run
+    :return: The number of messages sent again (the receivers without email are not counted)
+    """
+    message_histories = message_history_mdl.find_by_ids(message_history_id for _, message_history_id in resends)
+    messages = (__make_message_again(receiver, message_histories[message_history_id])
+                for receiver, message_history_id in resends if message_history_id in message_histories)
+    count = 0
+    with mail_sender_mdl.use_mail_sender(mail_sender) as sender:
+        chunk = []
+        for message in messages:
+            chunk.append(message)
+            if len(chunk) == sender.batch_size:
+                count += __send_and_save_personalized(sender, chunk)
+                chunk = []
+        if chunk:
+            count += __send_and_save_personalized(sender, chunk)
+    return count
+
+
+def __make_message_again(receiver, message_history):
+    """
+    :return: A tuple (email or None if the receiver has no email, new message history,
+    True if the email is addressed to the receiver)
+    """
+    txt_message = message_history.get_content_txt()
+    html_message = message_history.get_content_html()
+    new_message_history = message_history_mdl.MessageHistory(reference=message_history.reference,
+                                                             subject=message_history.subject,
+                                                             content_txt=txt_message,
+                                                             content_html=html_message,
+                                                             receiver_id=receiver.get('receiver_id'))
+    recipient = __get_recipient(receiver)
+    email = None
+    if recipient:
+        email = EmailMultiAlternatives(message_history.subject, txt_message, settings.DEFAULT_FROM_EMAIL, [recipient])
+        email.attach_alternative(html_message, "text/html")
+    return email, new_message_history, __is_addressed(receiver, email)
+
+
+def __send_and_save(receivers, reference=None, mail_sender=None, **kwargs):
     """
     Send the message :
     - by mail if person.mail exists
     Save the message in message_history table
     :param receivers List of the receivers of the message
     :param reference business reference of the message
+    :param mail_sender The MailSender used to send the message
     :param kwargs List of arguments used by the django EmailMultiAlternative class.
     The recipient_list argument is taken form the persons list.
     """
     recipient_list = []
     if receivers:
+        message_histories = []
+        addressed_message_histories = []
         for receiver in receivers:
-            if not settings.EMAIL_PRODUCTION_SENDING:
-                logger.info('Sending mail not in production to {}'.format(settings.COMMON_EMAIL_RECEIVER))
-                recipient_list.append(settings.COMMON_EMAIL_RECEIVER)
-            elif receiver.get('receiver_email'):
-                logger.info('Sending mail in production to {}'.format(receiver.get('receiver_email')))
-                recipient_list.append(receiver.get('receiver_email'))
-            message_history = message_history_mdl.MessageHistory(
+            recipient = __get_recipient(receiver)
+            if recipient:
+                recipient_list.append(recipient)
+            message_histories.append(message_history_mdl.MessageHistory(
                 reference=reference,
                 subject=kwargs.get('subject'),
                 content_txt=kwargs.get('message'),
                 content_html=kwargs.get('html_message'),
                 receiver_id=receiver.get('receiver_id'),
-                sent=timezone.now() if receiver.get('receiver_email') else None
-            )
-            message_history.save()
+                sent=timezone.now() if receiver.get('receiver_email') and not mail_sender.asynchronous else None
+            ))
+            if receiver.get('receiver_email'):
+                addressed_message_histories.append(message_histories[-1])
+        message_history_mdl.create_message_histories(message_histories)
         msg = EmailMultiAlternatives(kwargs.get('subject'), kwargs.get('message'), kwargs.get('from_email'),
                                      recipient_list, attachments=__get_attachments(kwargs))
         msg.attach_alternative(kwargs.get('html_message'), "text/html")
-        msg.send()
+        mail_sender.send([msg], [addressed_message_histories])
+
+
+def __get_recipient(receiver):
+    """
+    Get the email address to which the message of a receiver has to be sent.
+    Out of production, all the messages are sent to settings.COMMON_EMAIL_RECEIVER.
+    :return: The email address, None if the receiver has no email
+    """
+    if not settings.EMAIL_PRODUCTION_SENDING:
+        logger.info('Sending mail not in production to {}'.format(settings.COMMON_EMAIL_RECEIVER))
+        return settings.COMMON_EMAIL_RECEIVER
+    elif receiver.get('receiver_email'):
+        logger.info('Sending mail in production to {}'.format(receiver.get('receiver_email')))
+        return receiver.get('receiver_email')
+    return None
+
+
+def __is_addressed(receiver, email):
+    """
+    Out of production, the emails are sent to settings.COMMON_EMAIL_RECEIVER even for the receivers without email :
+    their message is not considered as sent to them.
+    """
+    return email is not None and bool(receiver.get('receiver_email'))
 
 
 def __get_attachments(attributes_message):
+    attachments = list(attributes_message.get("attachments") or [])
     attachment = attributes_message.get("attachment")
     if attachment:
-        return [attachment]
-    return None
+        attachments.insert(0, attachment)
+    return attachments or None
 
 
 def __make_tables_template_data(tables, lang_code):
     """
     Make table from data and header to insert into messages.
     :param tables: The lists of tables to inserts into template.
-    Table are created by message_config.create_table function
-    :return: The html tables and txt table to insert in each type of messages
+    Table are created by message_config.create_table function and prepared by table_renderer.prepare_tables
+    :return: The html tables and txt table to insert in each type of messages,
+    and the attachments replacing the tables too big to be inserted
     """
     html_templates_data = {}
     txt_templates_data = {}
+    attachments = []
     if tables:
         for table in tables:
             table_template_name = table.get('table_template_name')
             table_header_txt = table.get('header_txt')
             with translation.override(lang_code):
-                table_headers = (_(txt) for txt in table_header_txt)
-            table_data = table.get('data')
-            table_html = __render_table_template_as_string(
-                table_headers,
-                table_data,
-                True
-            )
-            table_txt = __render_table_template_as_string(
-                table_headers,
-                table_data,
-                False
-            )
+                table_headers = [_(txt) for txt in table_header_txt]
+                table_note = _('table_in_attachment')
+            if table_renderer.is_spilled(table):
+                attachments.append(table_renderer.get_spilled_table_attachment(table, table_headers))
+                table_note = table_note.format(table_renderer.get_spilled_table_file_name(table))
+                table_html = format_html('<p>{}</p>', table_note)
+                table_txt = table_note
+            else:
+                table_data = table.get('data')
+                table_html = table_renderer.render_table(table_headers, table_data, True, lang_code)
+                table_txt = table_renderer.render_table(table_headers, table_data, False, lang_code)
             html_templates_data[table_template_name] = table_html
             txt_templates_data[table_template_name] = table_txt
-    return html_templates_data, txt_templates_data
+    return html_templates_data, txt_templates_data, attachments
 
 
-def send_messages(message_content):
+def send_messages(message_content, mail_sender=None):
     """
     Send messages according to the message_content
     :param message_content: The message content and configuration dictionnary
     message_content is created by message_config.create_message_content function
+    :param mail_sender: The MailSender of the run, if the messages are sent as part of a run
     :return: An error message if something wrong,None else
     """
     html_template_ref = message_content.get('html_template_ref', None)
@@ -247,22 +323,117 @@ def send_messages(message_content):
     if not html_message_templates:
         return _('template_error').format(html_template_ref)
 
-    for lang_code, receivers in __map_receivers_by_languages(receivers).items():
-        html_table_data, txt_table_data = __make_tables_template_data(tables, lang_code)
+    tables = table_renderer.prepare_tables(tables)
+    with mail_sender_mdl.use_mail_sender(mail_sender) as sender:
+        for lang_code, receivers in __map_receivers_by_languages(receivers).items():
+            if not receivers:
+                continue
+            html_table_data, txt_table_data, table_attachments = __make_tables_template_data(tables, lang_code)
+            html_message_template, txt_message_template = _get_template_by_language_or_default(lang_code,
+                                                                                               html_message_templates,
+                                                                                               txt_message_templates)
+            if subject_data:
+                subject = html_message_template.subject.format(**subject_data)
+            else:
+                subject = html_message_template.subject
+            html_data = template_base_data.copy()
+            html_data.update(html_table_data)
+            txt_data = template_base_data.copy()
+            txt_data.update(txt_table_data)
+            attachments = ([attachment] if attachment else []) + table_attachments
+            __send_messages(html_message_template, txt_message_template, html_data, txt_data, receivers, subject,
+                            attachments, sender)
+
+    return None
+
+
+def send_personalized_messages(message_content, mail_sender=None):
+    """
+    Send one message to each receiver, rendered with the template base data updated with
+    the template data of the receiver (see message_config.create_receiver).
+    The messages are rendered one by one and sent by batches over the connection of the mail sender.
+    Each message is saved in history.
+    :param message_content: The message content and configuration dictionnary
+    message_content is created by message_config.create_message_content function
+    :param mail_sender: The MailSender of the run, if the messages are sent as part of a run
+    :return: An error message if something wrong,None else
+    """
+    html_template_ref = message_content.get('html_template_ref', None)
+    receivers = message_content.get('receivers', None)
+    if not (html_template_ref and receivers):
+        return _('message_content_error')
+    html_message_templates, txt_message_templates = _get_all_lang_templates([html_template_ref,
+                                                                             message_content.get('txt_template_ref')])
+    if not html_message_templates:
+        return _('template_error').format(html_template_ref)
+
+    messages = __render_personalized_messages(message_content, html_message_templates, txt_message_templates)
+    with mail_sender_mdl.use_mail_sender(mail_sender) as sender:
+        chunk = []
+        for message in messages:
+            chunk.append(message)
+            if len(chunk) == sender.batch_size:
+                __send_and_save_personalized(sender, chunk)
+                chunk = []
+        if chunk:
+            __send_and_save_personalized(sender, chunk)
+    return None
+
+
+def __render_personalized_messages(message_content, html_message_templates, txt_message_templates):
+    """
+    Render the message of each receiver.
+    The data shared by the receivers of a language (tables, subject) are computed once by language.
+    :return: A generator of tuple (email or None if the receiver has no email, message history,
+    True if the email is addressed to the receiver)
+    """
+    template_base_data = message_content.get('template_base_data') or {}
+    subject_data = message_content.get('subject_data', None)
+    signature = __get_signature()
+    tables = table_renderer.prepare_tables(message_content.get('tables'))
+    for lang_code, receivers in __map_receivers_by_languages(message_content.get('receivers')).items():
+        if not receivers:
+            continue
+        html_table_data, txt_table_data, table_attachments = __make_tables_template_data(tables, lang_code)
+        attachments = (__get_attachments(message_content) or []) + table_attachments
         html_message_template, txt_message_template = _get_template_by_language_or_default(lang_code,
                                                                                            html_message_templates,
                                                                                            txt_message_templates)
+        html_template = template_cache.get_compiled_template(html_message_template)
+        txt_template = template_cache.get_compiled_template(txt_message_template)
         if subject_data:
             subject = html_message_template.subject.format(**subject_data)
         else:
             subject = html_message_template.subject
-        html_data = template_base_data.copy()
-        html_data.update(html_table_data)
-        txt_data = template_base_data.copy()
-        txt_data.update(txt_table_data)
-        html_data['signature'] = render_to_string('messaging/html_email_signature.html', {
-            'logo_mail_signature_url': settings.LOGO_EMAIL_SIGNATURE_URL,
-            'logo_osis_url': settings.LOGO_OSIS_URL, })
-        __send_messages(html_message_template, txt_message_template, html_data, txt_data, receivers, subject, attachment)
+        subject = unescape(strip_tags(subject))
+        html_base_data = dict(template_base_data, signature=signature, **html_table_data)
+        txt_base_data = dict(template_base_data, **txt_table_data)
+        for receiver in receivers:
+            receiver_data = receiver.get('template_data') or {}
+            html_message = html_template.render(Context(dict(html_base_data, **receiver_data)))
+            txt_message = unescape(strip_tags(txt_template.render(Context(dict(txt_base_data, **receiver_data)))))
+            message_history = message_history_mdl.MessageHistory(subject=subject,
+                                                                 content_txt=txt_message,
+                                                                 content_html=html_message,
+                                                                 receiver_id=receiver.get('receiver_id'))
+            recipient = __get_recipient(receiver)
+            email = None
+            if recipient:
+                email = EmailMultiAlternatives(subject, txt_message, settings.DEFAULT_FROM_EMAIL, [recipient],
+                                               attachments=attachments)
+                email.attach_alternative(html_message, "text/html")
+            yield email, message_history, __is_addressed(receiver, email)
 
-    return None
+
+def __send_and_save_personalized(mail_sender, messages):
+    """
+    Send a chunk of messages with the mail sender and save them in history.
+    :param messages: A list of tuple (email or None, message history, True if the email is addressed to the receiver)
+    :return: The number of emails sent
+    """
+    for email, message_history, addressed in messages:
+        message_history.sent = timezone.now() if addressed and not mail_sender.asynchronous else None
+    message_history_mdl.create_message_histories([message_history for email, message_history, addressed in messages])
+    return mail_sender.send([email for email, message_history, addressed in messages if email],
+                     [[message_history] if addressed else []
+                      for email, message_history, addressed in messages if email])
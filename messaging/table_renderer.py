@@ -0,0 +1,196 @@
+##############################################################################
+#
+#    OSIS stands for Open Student Information System. It's an application
+#    designed to manage the core business of higher education institutions,
+#    such as universities, faculties, institutes and professional schools.
+#    The core business involves the administration of students, teachers,
+#    courses, programs and so on.
+#
+#    Copyright (C) 2015-2016 Université catholique de Louvain (http://www.uclouvain.be)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    A copy of this license - GNU General Public License - is available
+#    at the root of the source code of this program.  If not,
+#    see http://www.gnu.org/licenses/.
+#
+##############################################################################
+"""
+Rendering of the tables inserted in the messages (see message_config.create_table).
+The rendered tables are kept in a process-wide cache, keyed by the table template, the language and a digest
+of the headers and rows, so a same table sent in several messages is rendered once.
+Big tables are built directly by chunks of rows, without going through the template engine, which gives the same
+output. Huge tables are not inserted in the messages : their rows are written in a csv file attached to the messages.
+"""
+import csv
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+from itertools import chain, islice
+
+from django.conf import settings
+from django.template.loader import render_to_string
+from django.utils.encoding import force_text
+from django.utils.formats import localize
+from django.utils.html import conditional_escape
+
+HTML_TABLE_TEMPLATE = 'messaging/html_email_table_template.html'
+TXT_TABLE_TEMPLATE = 'messaging/txt_email_table_template.html'
+
+# Tables with more rows than this are built without the template engine
+DEFAULT_FAST_PATH_ROWS = 100
+# Tables with more rows than this are attached to the messages as csv files
+DEFAULT_MAX_INLINE_ROWS = 1000
+# The big tables are built by chunks of this number of rows, so that only the cells of one chunk are kept at once
+ROWS_PER_CHUNK = 100
+CACHE_SIZE = 128
+
+HTML_CELL_STYLE = 'padding: 5px;border: 1px solid black;'
+
+_rendered_tables = OrderedDict()
+_lock = threading.Lock()
+
+
+def prepare_tables(tables):
+    """
+    Read the rows of the tables once, so that they can be rendered for each language.
+    The data of a table can be any iterable of rows (a generator for example) ; it is read only once.
+    The tables having more rows than settings.EMAIL_TABLE_MAX_INLINE_ROWS (default 1000) are spilled :
+    their rows are kept only as the utf-8 encoded csv body of the attachment, built once for all the languages
+    (the attachment of a language is its header line followed by this body).
+    :param tables: The tables created by the message_config.create_table function
+    :return: The prepared tables
+    """
+    if not tables:
+        return tables
+    return [__prepare_table(table) for table in tables]
+
+
+def __prepare_table(table):
+    max_inline_rows = getattr(settings, 'EMAIL_TABLE_MAX_INLINE_ROWS', DEFAULT_MAX_INLINE_ROWS)
+    rows = iter(table.get('data') or ())
+    first_rows = list(islice(rows, max_inline_rows + 1))
+    if len(first_rows) <= max_inline_rows:
+        return dict(table, data=first_rows)
+    return dict(table, data=None, spilled_rows_csv=__spill_rows(chain(first_rows, rows)))
+
+
+def __spill_rows(rows):
+    """
+    :return: The rows written as csv, encoded in utf-8
+    """
+    output = io.BytesIO()
+    # The rows are encoded while they are written, without an intermediate string of the whole csv
+    csv_file = io.TextIOWrapper(output, encoding='utf-8', newline='')
+    csv.writer(csv_file).writerows(['' if item is None else item for item in row] for row in rows)
+    csv_file.detach()
+    return output.getvalue()
+
+
+def is_spilled(table):
+    return table.get('spilled_rows_csv') is not None
+
+
+def get_spilled_table_attachment(table, table_headers):
+    """
+    :param table: A spilled table, prepared by prepare_tables
+    :param table_headers: The header of the table as a list of Strings (already translated)
+    :return: The attachment (name, content, mimetype) containing the rows of the table
+    """
+    header_line = io.StringIO()
+    csv.writer(header_line).writerow([force_text(header) for header in table_headers])
+    content = header_line.getvalue().encode('utf-8') + table.get('spilled_rows_csv')
+    return get_spilled_table_file_name(table), content, 'text/csv'
+
+
+def get_spilled_table_file_name(table):
+    return '{}.csv'.format(table.get('table_template_name'))
+
+
+def render_table(table_headers, table_rows, html_format, lang_code=None):
+    """
+    Render a table as a string, in html or in txt.
+    :param table_headers: The header of the table as a list of Strings (already translated)
+    :param table_rows: The content of each row as a list of item list
+    :param html_format: True if you want the html table , False if you want the txt table
+    :param lang_code: The language of the message the table is inserted in
+    :return: The rendered table
+    """
+    template = HTML_TABLE_TEMPLATE if html_format else TXT_TABLE_TEMPLATE
+    key = (template, lang_code, __get_digest(table_headers, table_rows))
+    with _lock:
+        rendered_table = _rendered_tables.get(key)
+        if rendered_table is not None:
+            _rendered_tables.move_to_end(key)
+            return rendered_table
+    if len(table_rows) > getattr(settings, 'EMAIL_TABLE_FAST_PATH_ROWS', DEFAULT_FAST_PATH_ROWS):
+        rendered_table = __build_html_table(table_headers, table_rows) if html_format \
+            else __build_txt_table(table_headers, table_rows)
+    else:
+        rendered_table = render_to_string(template, {'table_headers': table_headers, 'table_rows': table_rows})
+    with _lock:
+        _rendered_tables[key] = rendered_table
+        if len(_rendered_tables) > CACHE_SIZE:
+            _rendered_tables.popitem(last=False)
+    return rendered_table
+
+
+def __get_digest(table_headers, table_rows):
+    return hashlib.sha1(repr((list(table_headers), list(table_rows))).encode('utf-8')).hexdigest()
+
+
+def __render_value(value):
+    """
+    Render a value as the template engine does ({{ value }}, with autoescape).
+    """
+    return conditional_escape(force_text(localize(value)))
+
+
+def __build_by_chunks(head, table_rows, build_row, tail):
+    """
+    Build a table, joining the parts of the rows chunk by chunk.
+    :param build_row: The function returning the list of the parts of a row
+    """
+    output = io.StringIO()
+    output.write(head)
+    for start in range(0, len(table_rows), ROWS_PER_CHUNK):
+        output.write(''.join(part for row in table_rows[start:start + ROWS_PER_CHUNK] for part in build_row(row)))
+    output.write(tail)
+    return output.getvalue()
+
+
+def __build_html_table(table_headers, table_rows):
+    cell = '<td style="{}">{{}}</td>'.format(HTML_CELL_STYLE)
+    head = ['<table style="margin: 5px;padding: 5px;border: 1px solid black;">',
+            '<thead style="{}">'.format(HTML_CELL_STYLE)]
+    head.extend(cell.format(__render_value(header)) for header in table_headers)
+    head.append('</thead><tbody style="border: 1px solid black;">')
+
+    def build_row(row):
+        parts = ['<tr>']
+        parts.extend(cell.format(__render_value('' if item is None else item)) for item in row)
+        parts.append('</tr>')
+        return parts
+    return __build_by_chunks(''.join(head), table_rows, build_row, '</tbody></table>')
+
+
+def __build_txt_table(table_headers, table_rows):
+    head = ['\n|']
+    head.extend('{} |'.format(__render_value(header)) for header in table_headers)
+    head.append('\n\n')
+
+    def build_row(row):
+        parts = ['\n|']
+        parts.extend('{}|'.format(__render_value(item)) for item in row)
+        parts.append('\n')
+        return parts
+    return __build_by_chunks(''.join(head), table_rows, build_row, '\n')
@@ -0,0 +1,138 @@
+##############################################################################
+#
+#    OSIS stands for Open Student Information System. It's an application
+#    designed to manage the core business of higher education institutions,
+#    such as universities, faculties, institutes and professional schools.
+#    The core business involves the administration of students, teachers,
+#    courses, programs and so on.
+#
+#    Copyright (C) 2015-2016 Université catholique de Louvain (http://www.uclouvain.be)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    A copy of this license - GNU General Public License - is available
+#    at the root of the source code of this program.  If not,
+#    see http://www.gnu.org/licenses/.
+#
+##############################################################################
+"""
+Process-wide cache of the compiled message templates.
+A compiled template is shared by all the threads of the process, keyed by the reference, the language and
+a digest of the template source : a template modified in another process is never served from the cache.
+Entries of a reference are dropped when a MessageTemplate of this reference is saved or deleted.
+
+The module also holds the registry of the message templates by reference and language.
+All the templates are loaded in one query the first time the registry is used, the missing references
+are then loaded in one query by call. As templates can be modified by another process, the entries
+of the registry expire after settings.MESSAGE_TEMPLATE_REGISTRY_TTL seconds (default 300).
+The registry returns new instances of the templates : a caller modifying a template does not modify the registry.
+The registry is not rolled back with the database transactions : the tests using templates
+empty it with clear() before and after each test.
+"""
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.template import Template
+
+from osis_common.models import message_template as message_template_mdl
+from osis_common.models.message_template import MessageTemplate
+
+DEFAULT_REGISTRY_TTL = 300
+
+_compiled_templates = {}
+# Templates by reference : reference -> (expiry time, {language: MessageTemplate})
+_registry = {}
+_registry_warmed = False
+_lock = threading.Lock()
+
+
+def get_compiled_template(message_template):
+    """
+    Get the compiled django Template of a message template, compiling it only if it is not in the cache.
+    :param message_template: The MessageTemplate
+    :return: The django Template
+    """
+    key = (message_template.reference,
+           message_template.language,
+           hashlib.sha1(message_template.template.encode('utf-8')).hexdigest())
+    compiled_template = _compiled_templates.get(key)
+    if compiled_template is None:
+        compiled_template = Template(message_template.template)
+        with _lock:
+            _compiled_templates[key] = compiled_template
+    return compiled_template
+
+
+def get_templates_by_language(references):
+    """
+    Get the templates of a list of references, for all their languages.
+    :param references: The list of templates references
+    :return: A list (in the order of the references) of dictionnaries with language as key and template as value.
+    The templates are new instances, copied from the registry.
+    """
+    global _registry_warmed
+    now = time.monotonic()
+    entries = {reference: _registry.get(reference) for reference in references}
+    missing_references = {reference for reference, entry in entries.items() if entry is None or entry[0] < now}
+    if missing_references:
+        if _registry_warmed:
+            message_templates = message_template_mdl.find_by_references(missing_references)
+        else:
+            message_templates = MessageTemplate.objects.all()
+        templates = {}
+        for message_template in message_templates:
+            templates.setdefault(message_template.reference, {})[message_template.language] = message_template
+        expiry = now + getattr(settings, 'MESSAGE_TEMPLATE_REGISTRY_TTL', DEFAULT_REGISTRY_TTL)
+        with _lock:
+            for reference in missing_references.union(templates):
+                _registry[reference] = (expiry, templates.get(reference, {}))
+                if reference in entries:
+                    entries[reference] = _registry[reference]
+            _registry_warmed = True
+    return [{language: __copy(message_template) for language, message_template in entries[reference][1].items()}
+            for reference in references]
+
+
+def __copy(message_template):
+    fields = MessageTemplate._meta.concrete_fields
+    return MessageTemplate.from_db(message_template._state.db, [field.attname for field in fields],
+                                   [getattr(message_template, field.attname) for field in fields])
+
+
+def invalidate(reference):
+    """
+    Remove the compiled templates and the registry entry of a reference from the cache.
+    """
+    with _lock:
+        for key in [key for key in _compiled_templates if key[0] == reference]:
+            del _compiled_templates[key]
+        _registry.pop(reference, None)
+
+
+def clear():
+    """
+    Empty the cache and the registry.
+    """
+    global _registry_warmed
+    with _lock:
+        _compiled_templates.clear()
+        _registry.clear()
+        _registry_warmed = False
+
+
+@receiver(post_save, sender=MessageTemplate)
+@receiver(post_delete, sender=MessageTemplate)
+def _invalidate_message_template(sender, instance, **kwargs):
+    invalidate(instance.reference)
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9 on 2026-10-18 11:03
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('osis_common', '0013_syncwatermark'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MessageContent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=40, unique=True)),
+                ('content_txt', models.TextField()),
+                ('content_html', models.TextField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='messagehistory',
+            name='message_content',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='osis_common.MessageContent'),
+        ),
+    ]
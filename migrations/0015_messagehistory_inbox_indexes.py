@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9 on 2026-10-18 12:10
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('osis_common', '0014_messagecontent'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='messagehistory',
+            index_together=set([('receiver_id', 'show_to_user', 'sent')]),
+        ),
+        migrations.RunSQL(
+            "CREATE INDEX osis_common_messagehistory_unread ON osis_common_messagehistory (receiver_id) "
+            "WHERE show_to_user AND NOT read_by_user",
+            "DROP INDEX osis_common_messagehistory_unread",
+        ),
+    ]
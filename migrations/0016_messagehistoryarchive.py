@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9 on 2026-10-18 12:40
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('osis_common', '0015_messagehistory_inbox_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MessageHistoryArchive',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('subject', models.CharField(max_length=255)),
+                ('content', models.BinaryField()),
+                ('receiver_id', models.IntegerField(db_index=True)),
+                ('created', models.DateTimeField(editable=False)),
+                ('sent', models.DateTimeField(null=True)),
+                ('reference', models.CharField(db_index=True, max_length=100, null=True)),
+                ('show_to_user', models.BooleanField(default=True)),
+                ('read_by_user', models.BooleanField(default=False)),
+            ],
+        ),
+    ]
@@ -23,11 +23,47 @@
 #    see http://www.gnu.org/licenses/.
 #
 ##############################################################################
-from django.db import models
+import datetime
+import hashlib
+import json
+import zlib
+
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.db.models import Q
 from django.utils import timezone
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.utils.module_loading import import_string
 from django.utils.safestring import mark_safe
 
+INBOX_PAGE_SIZE = 50
+# Heavy columns not needed to list the messages of an inbox
+CONTENT_FIELDS = ('content_txt', 'content_html')
+DEFAULT_RETENTION_DAYS = 365
+ARCHIVE_BATCH_SIZE = 1000
+
+
+def send_again_selected(modeladmin, request, queryset):
+    """
+    Admin action sending the selected messages again to their receivers.
+    The receivers are found by the function set in settings.MESSAGE_HISTORY_RECEIVERS_LOOKUP (dotted path),
+    which takes a set of receiver ids and returns a dict receiver_id: receiver (see message_config.create_receiver).
+    """
+    from osis_common.messaging import send_message
+    receivers_lookup = getattr(settings, 'MESSAGE_HISTORY_RECEIVERS_LOOKUP', None)
+    if not receivers_lookup:
+        modeladmin.message_user(request, 'MESSAGE_HISTORY_RECEIVERS_LOOKUP is not configured', level=messages.ERROR)
+        return
+    ids_and_receiver_ids = list(queryset.values_list('id', 'receiver_id'))
+    receivers = import_string(receivers_lookup)({receiver_id for _, receiver_id in ids_and_receiver_ids})
+    resends = [(receivers[receiver_id], message_history_id)
+               for message_history_id, receiver_id in ids_and_receiver_ids if receiver_id in receivers]
+    count = send_message.send_again_many(resends)
+    modeladmin.message_user(request, '{} message(s) sent again'.format(count))
+
+
+send_again_selected.short_description = 'Send again the selected messages'
+
 
 class MessageHistoryAdmin(admin.ModelAdmin):
     def has_add_permission(self, request):
@@ -42,15 +78,36 @@ class MessageHistoryAdmin(admin.ModelAdmin):
             del actions['delete_selected']
         return actions
 
+    actions = [send_again_selected]
     date_hierarchy = 'created'
     list_display = ('receiver_id', 'reference', 'subject', 'sent', 'created')
     fieldsets = ((None, {'fields': ('receiver_id', 'reference',
-                                    'subject', ('sent', 'created'), 'content_html_safe', 'content_txt')}),)
-    readonly_fields = ('receiver_id', 'reference', 'subject', 'sent', 'created', 'content_html_safe', 'content_txt')
+                                    'subject', ('sent', 'created'), 'content_html_safe', 'get_content_txt')}),)
+    readonly_fields = ('receiver_id', 'reference', 'subject', 'sent', 'created', 'content_html_safe',
+                       'get_content_txt')
     ordering = ['-created']
     search_fields = ['receiver_id', 'reference', 'subject']
 
 
+class MessageHistoryArchiveAdmin(MessageHistoryAdmin):
+    """
+    The archived messages are read only, and are not sent again.
+    """
+    actions = None
+
+
+class MessageContent(models.Model):
+    """
+    Content shared by all the message histories of a same message (see create_message_histories).
+    """
+    digest = models.CharField(max_length=40, unique=True)
+    content_txt = models.TextField()
+    content_html = models.TextField()
+
+    def __str__(self):
+        return self.digest
+
+
 class MessageHistory(models.Model):
     subject = models.CharField(max_length=255)
     content_txt = models.TextField()
@@ -61,6 +118,11 @@ class MessageHistory(models.Model):
     reference = models.CharField(max_length=100, null=True, db_index=True)
     show_to_user = models.BooleanField(default=True)
     read_by_user = models.BooleanField(default=False)
+    message_content = models.ForeignKey(MessageContent, null=True, blank=True, on_delete=models.PROTECT)
+
+    class Meta:
+        # Inbox queries of my osis ; the unread messages have their own partial index (see migration 0015)
+        index_together = (('receiver_id', 'show_to_user', 'sent'), )
 
     def save(self, *args, **kwargs):
         if not self.id:
@@ -70,13 +132,178 @@ class MessageHistory(models.Model):
     def __str__(self):
         return self.subject
 
+    def get_content_html(self):
+        if self.message_content_id:
+            return self.message_content.content_html
+        return self.content_html
+
+    def get_content_txt(self):
+        if self.message_content_id:
+            return self.message_content.content_txt
+        return self.content_txt
+    get_content_txt.short_description = 'content txt'
+
+    def content_html_safe(self):
+        return mark_safe(self.get_content_html())
+
+
+class MessageHistoryArchive(models.Model):
+    """
+    Message history older than the retention period (see archive_message_histories).
+    The archived messages keep their id, and their contents are compressed.
+    They are no more listed in the inbox of my osis.
+    """
+    id = models.IntegerField(primary_key=True)
+    subject = models.CharField(max_length=255)
+    content = models.BinaryField()
+    receiver_id = models.IntegerField(db_index=True)
+    created = models.DateTimeField(editable=False)
+    sent = models.DateTimeField(null=True)
+    reference = models.CharField(max_length=100, null=True, db_index=True)
+    show_to_user = models.BooleanField(default=True)
+    read_by_user = models.BooleanField(default=False)
+
+    def __str__(self):
+        return self.subject
+
+    def get_content_html(self):
+        return self.__get_contents().get('html')
+
+    def get_content_txt(self):
+        return self.__get_contents().get('txt')
+    get_content_txt.short_description = 'content txt'
+
     def content_html_safe(self):
-        return mark_safe(self.content_html)
+        return mark_safe(self.get_content_html())
+
+    def __get_contents(self):
+        return json.loads(zlib.decompress(bytes(self.content)).decode('utf-8'))
+
+
+def compress_contents(content_txt, content_html):
+    return zlib.compress(json.dumps({'txt': content_txt, 'html': content_html}).encode('utf-8'))
+
+
+def create_message_histories(message_histories):
+    """
+    Insert a list of message histories in bulk (one query instead of one by message history) if the database
+    returns the ids of a bulk insert (PostgreSQL), else one by one in a transaction.
+    If settings.MESSAGE_HISTORY_SHARED_CONTENT is True, the contents are stored once by distinct content
+    in MessageContent, and the message histories reference them instead of storing their own copy.
+    :param message_histories: The list of unsaved MessageHistory
+    :return: The list of inserted MessageHistory, with their ids
+    """
+    created = timezone.now()
+    for message_history in message_histories:
+        message_history.created = created
+    with transaction.atomic():
+        if getattr(settings, 'MESSAGE_HISTORY_SHARED_CONTENT', False):
+            __share_contents(message_histories)
+        if getattr(connection.features, 'can_return_ids_from_bulk_insert', False):
+            return MessageHistory.objects.bulk_create(message_histories)
+        # The ids are needed to set the sent date of the queued messages (see mail_queue)
+        for message_history in message_histories:
+            message_history.save()
+    return message_histories
+
+
+def __share_contents(message_histories):
+    message_contents = {}
+    for message_history in message_histories:
+        digest = hashlib.sha1('{}\0{}'.format(message_history.content_txt,
+                                               message_history.content_html).encode('utf-8')).hexdigest()
+        if digest not in message_contents:
+            # The content is locked until the message histories referencing it are inserted,
+            # so that it is not deleted by a concurrent archiving (see __delete_unused_contents)
+            message_contents[digest], created = MessageContent.objects.select_for_update().get_or_create(
+                digest=digest,
+                defaults={'content_txt': message_history.content_txt,
+                          'content_html': message_history.content_html})
+        message_history.message_content = message_contents[digest]
+        message_history.content_txt = ''
+        message_history.content_html = ''
 
 
 def find_by_id(message_history_id):
-    message_history = MessageHistory.objects.get(id=message_history_id)
-    return message_history
+    """
+    Get a message history, from the archive if it has been archived
+    (the archived message histories have the same interface for their contents).
+    """
+    try:
+        return MessageHistory.objects.get(id=message_history_id)
+    except MessageHistory.DoesNotExist:
+        message_history = MessageHistoryArchive.objects.filter(id=message_history_id).first()
+        if message_history is None:
+            raise
+        return message_history
+
+
+def find_by_ids(message_histories_ids):
+    """
+    Get message histories in one query (and one more for the archived ones).
+    :return: A dict message_history_id: message history
+    """
+    message_histories_ids = set(message_histories_ids)
+    message_histories = {message_history.id: message_history for message_history in
+                         MessageHistory.objects.filter(id__in=message_histories_ids).select_related('message_content')}
+    archived_ids = message_histories_ids - message_histories.keys()
+    if archived_ids:
+        message_histories.update((message_history.id, message_history) for message_history in
+                                 MessageHistoryArchive.objects.filter(id__in=archived_ids))
+    return message_histories
+
+
+def archive_message_histories(retention_days=None, batch_size=ARCHIVE_BATCH_SIZE):
+    """
+    Move the message histories created before the retention period to the archive, by batches.
+    Each batch is moved in its own transaction, so that the job can be stopped and launched again.
+    The shared contents (MessageContent) no more used by any message history are deleted.
+    :param retention_days: The number of days the message histories stay in MessageHistory,
+    settings.MESSAGE_HISTORY_RETENTION_DAYS by default (365 if not set)
+    :param batch_size: The number of message histories moved by transaction
+    :return: The number of archived message histories
+    """
+    if retention_days is None:
+        retention_days = getattr(settings, 'MESSAGE_HISTORY_RETENTION_DAYS', DEFAULT_RETENTION_DAYS)
+    created_before = timezone.now() - datetime.timedelta(days=retention_days)
+    count = 0
+    while True:
+        with transaction.atomic():
+            message_histories = list(MessageHistory.objects.filter(created__lt=created_before)
+                                                           .select_related('message_content')
+                                                           .order_by('id')[:batch_size])
+            if not message_histories:
+                return count
+            MessageHistoryArchive.objects.bulk_create([__make_archive(message_history)
+                                                       for message_history in message_histories])
+            MessageHistory.objects.filter(id__in=[message_history.id for message_history in message_histories])\
+                                  .delete()
+            __delete_unused_contents({message_history.message_content_id for message_history in message_histories
+                                      if message_history.message_content_id})
+        count += len(message_histories)
+
+
+def __delete_unused_contents(message_contents_ids):
+    if message_contents_ids:
+        # Wait for the sendings using these contents (see __share_contents), then check that they are unused
+        message_contents_ids = list(MessageContent.objects.select_for_update().filter(id__in=message_contents_ids)
+                                                          .values_list('id', flat=True))
+        used_contents_ids = MessageHistory.objects.filter(message_content_id__in=message_contents_ids)\
+                                                  .values('message_content_id')
+        MessageContent.objects.filter(id__in=message_contents_ids).exclude(id__in=used_contents_ids).delete()
+
+
+def __make_archive(message_history):
+    return MessageHistoryArchive(id=message_history.id,
+                                 subject=message_history.subject,
+                                 content=compress_contents(message_history.get_content_txt(),
+                                                           message_history.get_content_html()),
+                                 receiver_id=message_history.receiver_id,
+                                 created=message_history.created,
+                                 sent=message_history.sent,
+                                 reference=message_history.reference,
+                                 show_to_user=message_history.show_to_user,
+                                 read_by_user=message_history.read_by_user)
 
 
 def find_my_messages(person_id):
@@ -88,6 +315,38 @@ def find_my_messages(person_id):
     return MessageHistory.objects.filter(receiver_id=person_id).filter(show_to_user=True).order_by('sent')
 
 
+def find_my_messages_page(person_id, after_message_id=None, page_size=INBOX_PAGE_SIZE):
+    """
+    Get a page of the messages for a person, the most recent first, without their content.
+    The pages are keyset paginated on (sent, id) : the cost of a page does not depend on its position in the inbox.
+    The messages never sent (sent is null) come first, as in the PostgreSQL descending order.
+    :param person_id: The id of the person who belongs the messages
+    :param after_message_id: The id of the last message of the previous page, None for the first page
+    :param page_size: The maximum number of messages in the page
+    :return: The list of messages of the page
+    """
+    queryset = MessageHistory.objects.filter(receiver_id=person_id, show_to_user=True)
+    if after_message_id is not None:
+        after_sent = MessageHistory.objects.filter(id=after_message_id).values_list('sent', flat=True).first()
+        queryset = queryset.filter(__get_after_message_filter(after_message_id, after_sent))
+    return list(queryset.defer(*CONTENT_FIELDS).order_by('-sent', '-id')[:page_size])
+
+
+def __get_after_message_filter(after_message_id, after_sent):
+    if after_sent is None:
+        return Q(sent__isnull=True, id__lt=after_message_id) | Q(sent__isnull=False)
+    return Q(sent__lt=after_sent) | Q(sent=after_sent, id__lt=after_message_id)
+
+
+def count_my_unread_messages(person_id):
+    """
+    Count the unread messages for a person (uses the partial index on the unread messages)
+    :param person_id: The id of the person who belongs the messages
+    :return: The number of unread messages
+    """
+    return MessageHistory.objects.filter(receiver_id=person_id, show_to_user=True, read_by_user=False).count()
+
+
 def delete_my_messages(messages_ids):
     """
     Delete messages from my osis (but not from history)
@@ -64,6 +64,10 @@ def find_by_reference(reference):
     return message_template
 
 
+def find_by_references(references):
+    return MessageTemplate.objects.filter(reference__in=references)
+
+
 def find_by_reference_and_language(reference, language=settings.LANGUAGE_CODE):
     message_template = MessageTemplate.objects.get(reference=reference, language=language)
     return message_template
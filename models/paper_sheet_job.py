@@ -0,0 +1,76 @@
+##############################################################################
+#
+#    OSIS stands for Open Student Information System. It's an application
+#    designed to manage the core business of higher education institutions,
+#    such as universities, faculties, institutes and professional schools.
+#    The core business involves the administration of students, teachers,
+#    courses, programs and so on.
+#
+#    Copyright (C) 2015-2016 Université catholique de Louvain (http://www.uclouvain.be)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    A copy of this license - GNU General Public License - is available
+#    at the root of the source code of this program.  If not,
+#    see http://www.gnu.org/licenses/.
+#
+##############################################################################
+import uuid
+
+from django.db import models
+from django.contrib import admin
+
+
+class PaperSheetJobAdmin(admin.ModelAdmin):
+    list_display = ('uuid', 'status', 'progress', 'requested_by', 'created', 'updated')
+    readonly_fields = ('uuid', 'created', 'updated')
+    list_filter = ('status',)
+    search_fields = ['uuid', 'requested_by']
+
+
+class PaperSheetJob(models.Model):
+    """
+    A scores sheets pdf rendered in background by the workers of document.paper_sheet_jobs.
+    """
+    PENDING = 'PENDING'
+    RUNNING = 'RUNNING'
+    DONE = 'DONE'
+    FAILED = 'FAILED'
+    STATUS_CHOICES = ((PENDING, PENDING),
+                      (RUNNING, RUNNING),
+                      (DONE, DONE),
+                      (FAILED, FAILED))
+
+    uuid = models.UUIDField(default=uuid.uuid4, unique=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    progress = models.IntegerField(default=0)
+    document_file = models.ForeignKey('DocumentFile', null=True, blank=True, on_delete=models.SET_NULL)
+    error = models.TextField(null=True, blank=True)
+    requested_by = models.CharField(max_length=254, default='system', db_index=True)
+    created = models.DateTimeField(auto_now_add=True, editable=False)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return str(self.uuid)
+
+
+def find_by_uuid(job_uuid):
+    try:
+        return PaperSheetJob.objects.get(uuid=job_uuid)
+    except PaperSheetJob.DoesNotExist:
+        return None
+
+
+def update_job(job_uuid, **kwargs):
+    """
+    Update fields of a job without reading it.
+    """
+    PaperSheetJob.objects.filter(uuid=job_uuid).update(**kwargs)
@@ -26,7 +26,7 @@
 import logging
 from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
-from django.db import models, IntegrityError
+from django.db import models, IntegrityError, connections, router, transaction
 from django.db.models import DateTimeField, DateField
 from django.core import serializers
 import uuid
@@ -38,9 +38,15 @@ import datetime
 from django.utils.encoding import force_text
 from django.apps import apps
 import time
+import hashlib
 
 LOGGER = logging.getLogger(settings.DEFAULT_LOGGER)
 
+# Wire schema id by model label
+_schema_ids = {}
+# Decoders by (model label, schema id)
+_decoders = {}
+
 
 class SerializableQuerySet(models.QuerySet):
     # Called in case of bulk delete
@@ -70,7 +76,8 @@ class SerializableModel(models.Model):
             try:
                 ser_obj = serialize(self)
                 queue_sender.send_message(settings.QUEUES.get('QUEUES_NAME').get('MIGRATIONS_TO_PRODUCE'),
-                                          wrap_serialization(ser_obj))
+                                          wrap_serialization(ser_obj),
+                                          partition_key=self.uuid)
             except (ChannelClosed, ConnectionClosed):
                 LOGGER.exception('QueueServer is not installed or not launched')
 
@@ -80,7 +87,8 @@ class SerializableModel(models.Model):
             try:
                 ser_obj = serialize(self)
                 queue_sender.send_message(settings.QUEUES.get('QUEUES_NAME').get('MIGRATIONS_TO_PRODUCE'),
-                                          wrap_serialization(ser_obj, to_delete=True))
+                                          wrap_serialization(ser_obj, to_delete=True),
+                                          partition_key=self.uuid)
             except (ChannelClosed, ConnectionClosed):
                 LOGGER.exception('QueueServer is not installed or not launched')
 
@@ -177,7 +185,8 @@ def serialize(obj, last_syncs=None):
         last_sync = None
         if last_syncs:
             last_sync = _convert_datetime_to_long(last_syncs.get(class_label))
-        return {"model": class_label, "fields": dict, 'last_sync': last_sync}
+        return {"model": class_label, "fields": dict, 'last_sync': last_sync,
+                'schema': get_schema_id(obj.__class__)}
     else:
         return None
 
@@ -186,13 +195,6 @@ def _convert_datetime_to_long(dtime):
     return time.mktime(dtime.timetuple()) if dtime else None
 
 
-def _get_value(fields, field):
-    attribute = fields.get(field.name)
-    if isinstance(field, DateTimeField) or isinstance(field, DateField):
-        return _convert_long_to_datetime(attribute)
-    return attribute
-
-
 def _convert_long_to_datetime(date_as_long):
     return datetime.datetime.fromtimestamp(date_as_long) if date_as_long else None
 
@@ -203,32 +205,130 @@ def _get_field_name(field):
     return field.name
 
 
+def get_schema_id(model_class):
+    """
+    Get the id of the wire schema of a model, which is a hash of the names and types of its fields.
+    The producer and the consumer of a model have the same schema id as long as their models did not drift.
+    :param model_class: The model
+    :return: The schema id, as a string
+    """
+    label = model_class._meta.label
+    schema_id = _schema_ids.get(label)
+    if not schema_id:
+        schema = ';'.join('{}:{}'.format(f.name, f.get_internal_type())
+                          for f in sorted(model_class._meta.fields, key=lambda f: f.name))
+        schema_id = hashlib.sha1(schema.encode('utf-8')).hexdigest()[:16]
+        _schema_ids[label] = schema_id
+    return schema_id
+
+
+def _get_decoder(model_class, structure):
+    """
+    Get the decoder converting the serialized fields of a structure into model kwargs.
+    Decoders are built once by model and schema id ; a schema drift is logged when the decoder is built.
+    :return: A tuple of (serialized field name, kwarg name, converter or None)
+    """
+    schema_id = structure.get('schema')
+    key = (model_class._meta.label, schema_id)
+    decoder = _decoders.get(key)
+    if decoder is None:
+        # Messages from producers not sending the schema id are decoded with the local schema
+        if schema_id and schema_id != get_schema_id(model_class):
+            unknown_fields = set(structure.get('fields').keys()) - {f.name for f in model_class._meta.fields}
+            LOGGER.warning('Schema drift for model {} : received schema {}, local schema {}. '
+                           'Unknown fields ignored : {}'.format(model_class._meta.label, schema_id,
+                                                                get_schema_id(model_class),
+                                                                ', '.join(sorted(unknown_fields)) or '-'))
+        decoder = tuple((f.name,
+                         _get_field_name(f),
+                         _convert_long_to_datetime if isinstance(f, (DateTimeField, DateField)) else None)
+                        for f in model_class._meta.fields)
+        _decoders[key] = decoder
+    return decoder
+
+
+def _decode(decoder, fields):
+    return {kwarg_name: converter(fields[field_name]) if converter else fields[field_name]
+            for field_name, kwarg_name, converter in decoder if field_name in fields}
+
+
 def persist(structure):
     model_class = apps.get_model(structure.get('model'))
     if structure:
         fields = structure.get('fields')
-        query_set = model_class.objects.filter(uuid=fields.get('uuid'))
-        persisted_obj = query_set.first()
-        if _changed_since_last_synchronization(fields, structure) or not persisted_obj:
-            for field_name, value in fields.items():
-                if isinstance(value, dict):
-                    fields[field_name] = persist(value)
-            kwargs = {_get_field_name(f): _get_value(fields, f) for f in model_class._meta.fields if f.name in fields.keys()}
-            if persisted_obj:
-                kwargs['id'] = persisted_obj.id
-                query_set.update(**kwargs)
-                return persisted_obj.id
-            else:
-                del kwargs['id']
-                model_class.objects.bulk_create([model_class(**kwargs)])
-                ids = model_class.objects.filter(uuid=kwargs.get('uuid')).values_list('id', flat=True)
-                return ids[0]
-        else:
-            return persisted_obj.id
+        if not _changed_since_last_synchronization(fields, structure):
+            persisted_id = model_class.objects.filter(uuid=fields.get('uuid')).values_list('id', flat=True).first()
+            if persisted_id:
+                return persisted_id
+        for field_name, value in fields.items():
+            if isinstance(value, dict):
+                fields[field_name] = persist(value)
+        kwargs = _decode(_get_decoder(model_class, structure), fields)
+        kwargs.pop('id', None)
+        return _upsert(model_class, kwargs)
     else:
         return None
 
 
+def _upsert(model_class, kwargs):
+    """
+    Insert the record described by kwargs or update the one having the same uuid.
+    On PostgreSQL, it is done in a single 'INSERT ... ON CONFLICT (uuid) DO UPDATE ... RETURNING id' query,
+    which is also safe when several consumers persist the same record at the same time.
+    :param model_class: The model of the record
+    :param kwargs: The values of the record, by attribute name (the uuid is mandatory)
+    :return: The id of the inserted or updated record
+    """
+    db_connection = connections[router.db_for_write(model_class)]
+    if db_connection.vendor == 'postgresql':
+        return _upsert_postgresql(db_connection, model_class, kwargs)
+    return _upsert_generic(model_class, kwargs)
+
+
+def _upsert_postgresql(db_connection, model_class, kwargs):
+    quote_name = db_connection.ops.quote_name
+    instance = model_class(**kwargs)
+    insert_fields = [f for f in model_class._meta.local_concrete_fields if not f.primary_key]
+    insert_params = [f.get_db_prep_save(f.pre_save(instance, True), db_connection) for f in insert_fields]
+    # The update only touches the received values, like a queryset update() would do.
+    update_fields = [f for f in insert_fields if f.attname in kwargs and f.name != 'uuid']
+    update_params = [f.get_db_prep_save(kwargs.get(f.attname), db_connection) for f in update_fields]
+    uuid_column = quote_name(model_class._meta.get_field('uuid').column)
+    if update_fields:
+        update_sql = ', '.join('{} = %s'.format(quote_name(f.column)) for f in update_fields)
+    else:
+        # A 'DO UPDATE' is needed for the conflicting row to be returned
+        update_sql = '{0} = EXCLUDED.{0}'.format(uuid_column)
+    sql = 'INSERT INTO {table} ({columns}) VALUES ({values}) ' \
+          'ON CONFLICT ({uuid}) DO UPDATE SET {update} RETURNING {pk}'.format(
+              table=quote_name(model_class._meta.db_table),
+              columns=', '.join(quote_name(f.column) for f in insert_fields),
+              values=', '.join(['%s'] * len(insert_fields)),
+              uuid=uuid_column,
+              update=update_sql,
+              pk=quote_name(model_class._meta.pk.column))
+    with db_connection.cursor() as cursor:
+        cursor.execute(sql, insert_params + update_params)
+        return cursor.fetchone()[0]
+
+
+def _upsert_generic(model_class, kwargs):
+    query_set = model_class.objects.filter(uuid=kwargs.get('uuid'))
+    persisted_id = query_set.values_list('id', flat=True).first()
+    if not persisted_id:
+        try:
+            with transaction.atomic():
+                obj = model_class(**kwargs)
+                # save_base() does not call SerializableModel.save(), so the record is not sent back to the queue
+                obj.save_base(force_insert=True)
+                return obj.id
+        except IntegrityError:
+            # Inserted in the meantime by another consumer
+            persisted_id = query_set.values_list('id', flat=True).first()
+    query_set.update(**kwargs)
+    return persisted_id
+
+
 def _changed_since_last_synchronization(fields, structure):
     last_sync = _convert_long_to_datetime(structure.get('last_sync'))
     changed = _convert_long_to_datetime(fields.get('changed'))
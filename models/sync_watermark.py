@@ -0,0 +1,59 @@
+##############################################################################
+#
+#    OSIS stands for Open Student Information System. It's an application
+#    designed to manage the core business of higher education institutions,
+#    such as universities, faculties, institutes and professional schools.
+#    The core business involves the administration of students, teachers,
+#    courses, programs and so on.
+#
+#    Copyright (C) 2015-2016 Université catholique de Louvain (http://www.uclouvain.be)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    A copy of this license - GNU General Public License - is available
+#    at the root of the source code of this program.  If not,
+#    see http://www.gnu.org/licenses/.
+#
+##############################################################################
+from django.db import models
+from django.contrib import admin
+
+
+class SyncWatermarkAdmin(admin.ModelAdmin):
+    list_display = ('model_label', 'last_sync', 'updated')
+    readonly_fields = ('updated',)
+    search_fields = ['model_label']
+
+
+class SyncWatermark(models.Model):
+    """
+    The last synchronization date of a model sent by the delta synchronization (scripts/delta_sync.py).
+    """
+    model_label = models.CharField(max_length=100, unique=True)
+    last_sync = models.DateTimeField(null=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.model_label
+
+
+def find_by_model_label(model_label):
+    try:
+        return SyncWatermark.objects.get(model_label=model_label)
+    except SyncWatermark.DoesNotExist:
+        return None
+
+
+def find_last_syncs():
+    """
+    :return: A dict model label: last synchronization date, as used by serializable_model.serialize
+    """
+    return dict(SyncWatermark.objects.exclude(last_sync__isnull=True).values_list('model_label', 'last_sync'))
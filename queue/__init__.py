@@ -25,5 +25,6 @@
 ##############################################################################
 
 from osis_common.queue import callbacks
+from osis_common.queue import partitioning
 from osis_common.queue import queue_listener
 from osis_common.queue import queue_sender
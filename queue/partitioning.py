@@ -0,0 +1,99 @@
+##############################################################################
+#
+#    OSIS stands for Open Student Information System. It's an application
+#    designed to manage the core business of higher education institutions,
+#    such as universities, faculties, institutes and professional schools.
+#    The core business involves the administration of students, teachers,
+#    courses, programs and so on.
+#
+#    Copyright (C) 2015-2016 Université catholique de Louvain (http://www.uclouvain.be)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    A copy of this license - GNU General Public License - is available
+#    at the root of the source code of this program.  If not,
+#    see http://www.gnu.org/licenses/.
+#
+##############################################################################
+"""
+Consistent-hash partitioning of a queue.
+A partitioned queue is split in several queues ('<queue_name>_<partition>') and the messages about an entity
+(identified by its uuid) are always routed to the same partition. So, each partition can be consumed by its own
+consumer while the messages about an entity are still processed in order.
+The number of partitions of a queue is configured in settings.QUEUES :
+    QUEUES = {
+        ...
+        'QUEUES_PARTITIONS': {'osis_portal': 4},
+    }
+A queue not listed in 'QUEUES_PARTITIONS' is not partitioned.
+"""
+import hashlib
+
+from django.conf import settings
+
+
+def get_partitions_count(queue_name):
+    if hasattr(settings, 'QUEUES'):
+        return settings.QUEUES.get('QUEUES_PARTITIONS', {}).get(queue_name, 1)
+    return 1
+
+
+def get_partition(partition_key, partitions_count):
+    """
+    Get the partition of a key, using the jump consistent hash algorithm (Lamping & Veach).
+    When the number of partitions changes from n to n+1, only 1/(n+1) of the keys move to another partition.
+    :param partition_key: The key of the entity (usually its uuid)
+    :param partitions_count: The number of partitions
+    :return: The partition number, between 0 and partitions_count - 1
+    """
+    key = int(hashlib.md5(str(partition_key).encode('utf-8')).hexdigest()[:16], 16)
+    partition, candidate = -1, 0
+    while candidate < partitions_count:
+        partition = candidate
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        candidate = int((partition + 1) * (float(1 << 31) / float((key >> 33) + 1)))
+    return partition
+
+
+def get_partition_queue_name(queue_name, partition):
+    return '{}_{}'.format(queue_name, partition)
+
+
+def get_partition_queue_names(queue_name):
+    """
+    :return: The names of all the queues of a queue, which is only the queue name if it is not partitioned
+    """
+    partitions_count = get_partitions_count(queue_name)
+    if partitions_count > 1:
+        return [get_partition_queue_name(queue_name, partition) for partition in range(partitions_count)]
+    return [queue_name]
+
+
+def route(queue_name, partition_key):
+    """
+    Get the queue in which a message about an entity has to be sent.
+    :param queue_name: The name of the (maybe partitioned) queue
+    :param partition_key: The key of the entity (usually its uuid) ; None if the message is not about an entity
+    :return: The name of the partition queue, or queue_name if the queue is not partitioned
+    """
+    partitions_count = get_partitions_count(queue_name)
+    if partition_key is None or partitions_count <= 1:
+        return queue_name
+    return get_partition_queue_name(queue_name, get_partition(partition_key, partitions_count))
+
+
+def declare_partition_queues(channel, queue_name):
+    """
+    Declare all the queues of a queue on a channel.
+    Needed before sending partitioned messages through a channel that was not opened by queue_sender.send_message.
+    """
+    for name in get_partition_queue_names(queue_name):
+        channel.queue_declare(queue=name, durable=True)
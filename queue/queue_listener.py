@@ -34,14 +34,19 @@ from django.conf import settings
 import threading
 import logging
 from osis_common.models.queue_exception import QueueException
+from osis_common.queue import partitioning
 
 logger = logging.getLogger(settings.DEFAULT_LOGGER)
 queue_exception_logger = logging.getLogger(settings.QUEUE_EXCEPTION_LOGGER)
 
 
-class ScoresSheetClient(object):
-    def __init__(self):
-        self.paper_sheet_queue = settings.QUEUES.get('QUEUES_NAME').get('PAPER_SHEET')
+class RpcClient(object):
+    """
+    Client sending requests in a queue and waiting for the reply (RPC over the queue).
+    The consumer of the queue answers with the response of its callback (see ExampleConsumer.on_message).
+    """
+    def __init__(self, queue_name):
+        self.queue_name = queue_name
         credentials = pika.PlainCredentials(settings.QUEUES.get('QUEUE_USER'),
                                             settings.QUEUES.get('QUEUE_PASSWORD'))
         self.connection = pika.BlockingConnection(pika.ConnectionParameters(settings.QUEUES.get('QUEUE_URL'),
@@ -61,35 +66,48 @@ class ScoresSheetClient(object):
         if self.corr_id == props.correlation_id:
             self.response = body
 
-    def call(self, n):
+    def call(self, body):
         self.response = None
         self.corr_id = str(uuid.uuid4())
         self.channel.basic_publish(exchange='',
-                                   routing_key=self.paper_sheet_queue,
+                                   routing_key=self.queue_name,
                                    properties=pika.BasicProperties(
                                          reply_to=self.callback_queue,
                                          correlation_id=self.corr_id,
                                          content_type='application/json',
                                          ),
-                                   body=str(n))
+                                   body=body)
         while self.response is None:
             self.connection.process_data_events()
         return self.response
 
+    def close(self):
+        self.connection.close()
+
+
+class ScoresSheetClient(RpcClient):
+    def __init__(self):
+        self.paper_sheet_queue = settings.QUEUES.get('QUEUES_NAME').get('PAPER_SHEET')
+        super(ScoresSheetClient, self).__init__(self.paper_sheet_queue)
+
+    def call(self, n):
+        return super(ScoresSheetClient, self).call(str(n))
+
 
 class SynchronousConsumerThread(threading.Thread):
-    def __init__(self, queue_name, callback, *args, **kwargs):
+    def __init__(self, queue_name, callback, *args, prefetch_count=None, **kwargs):
         super(SynchronousConsumerThread, self).__init__(*args, **kwargs)
 
+        self._prefetch_count = prefetch_count
         self._queue_name = queue_name
         self.callback = callback
         self.daemon = True
 
     def run(self):
-        listen_queue_synchronously(self._queue_name, self.callback)
+        listen_queue_synchronously(self._queue_name, self.callback, prefetch_count=self._prefetch_count)
 
 
-def listen_queue_synchronously(queue_name, callback, counter=3):
+def listen_queue_synchronously(queue_name, callback, counter=3, prefetch_count=None):
 
     def on_message(channel, method_frame, header_frame, body):
         try:
@@ -130,7 +148,9 @@ def listen_queue_synchronously(queue_name, callback, counter=3):
                           # auto_delete=False,
                           )
     logger.debug("Queue declared.")
-    # channel.basic_qos(prefetch_count=1)
+    if prefetch_count:
+        # Needed to share the messages between several consumers of the queue
+        channel.basic_qos(prefetch_count=prefetch_count)
     logger.debug("Declaring on message callback...")
     channel.basic_consume(on_message, queue_name)
     logger.debug("Done.")
@@ -141,7 +161,7 @@ def listen_queue_synchronously(queue_name, callback, counter=3):
     except KeyboardInterrupt:
         channel.stop_consuming()
     except ConnectionClosed:
-        listen_queue_synchronously(queue_name, callback, counter - 1)
+        listen_queue_synchronously(queue_name, callback, counter - 1, prefetch_count)
     connection.close()
 
 
@@ -171,6 +191,23 @@ def listen_queue(queue_name, callback):
         consumer_thread.stop()
 
 
+def listen_partitioned_queue(queue_name, callback, partitions=None):
+    """
+    Listen the partitions of a partitioned queue, each one in its own consumer thread.
+    Messages of a partition are consumed in order, so the messages about an entity are processed in order.
+    :param queue_name: The name of the partitioned queue (as configured in settings.QUEUES['QUEUES_PARTITIONS']).
+    :param callback: The action to perform when a message is consumed. (It is a function).
+    :param partitions: The partitions this process is pinned to. All the partitions if None.
+    When several processes consume a queue, each partition must be listened by one process only.
+    """
+    if partitions is None:
+        queue_names = partitioning.get_partition_queue_names(queue_name)
+    else:
+        queue_names = [partitioning.get_partition_queue_name(queue_name, partition) for partition in partitions]
+    for name in queue_names:
+        listen_queue(name, callback)
+
+
 class ConsumerThread(threading.Thread):
     def __init__(self, connection_parameters, callback, *args, **kwargs):
         super(ConsumerThread, self).__init__(*args, **kwargs)
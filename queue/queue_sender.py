@@ -29,6 +29,7 @@ import pika
 from pika import exceptions
 import logging
 from django.conf import settings
+from osis_common.queue import partitioning
 
 logger = logging.getLogger(settings.DEFAULT_LOGGER)
 
@@ -55,7 +56,7 @@ def get_channel(connection, queue_name):
         return None
 
 
-def send_message(queue_name, message, connection=None, channel=None):
+def send_message(queue_name, message, connection=None, channel=None, partition_key=None):
     """
     Send the message in the queue passed in parameter.
     If the connection doesn't exist, the function will create it, send the message, then close the connection.
@@ -69,10 +70,15 @@ def send_message(queue_name, message, connection=None, channel=None):
     :param message: JSON data sent into the queue.
     :param connection: A connection to a Queue.
     :param channel: An opened channel from the connection given in parameter.
+    :param partition_key: The key (usually the uuid) of the entity the message is about.
+    If the queue is partitioned, the message is sent in the partition of this key (see queue.partitioning).
+    When a channel is given, its partition queues must have been declared (partitioning.declare_partition_queues).
     """
     if channel and not connection:
         raise Exception('Please give the connection from which you opened the channel given by parameter')
 
+    queue_name = partitioning.route(queue_name, partition_key)
+
     connection_open = False
     channel_open = False
 
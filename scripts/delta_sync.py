@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+##############################################################################
+#
+#    OSIS stands for Open Student Information System. It's an application
+#    designed to manage the core business of higher education institutions,
+#    such as universities, faculties, institutes and professional schools.
+#    The core business involves the administration of students, teachers,
+#    courses, programs and so on.
+#
+#    Copyright (C) 2015-2016 Université catholique de Louvain (http://www.uclouvain.be)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    A copy of this license - GNU General Public License - is available
+#    at the root of the source code of this program.  If not,
+#    see http://www.gnu.org/licenses/.
+#
+##############################################################################
+"""
+This script is used to send to the queue only the data changed since the last synchronization (delta sync).
+For each model, the rows having a 'changed' date after the watermark of the model are sent by batches,
+then the new watermark is stored (model SyncWatermark). The first synchronization of a model sends all its rows.
+The rows without 'changed' date cannot be compared with the watermark : they are sent by each synchronization.
+The 'changed' column of the synchronized models should be indexed.
+The script functions have to be launched from common line 'dbshell' in osis or osis-portal environnment.
+
+ex delta synchronization of persons and tutors from osis:
+(VENV) cd /path/to/osis
+(VENV) python3 manage.py shell
+~ from osis_common.scripts import delta_sync
+~ delta_sync.sync_models([('base', ['person', 'tutor'])])
+"""
+import datetime
+
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Q
+from django.utils import timezone
+from pika.exceptions import ChannelClosed, ConnectionClosed
+from osis_common.models import sync_watermark
+from osis_common.models.serializable_model import serialize, wrap_serialization
+from osis_common.queue import queue_sender, partitioning
+
+DEFAULT_BATCH_SIZE = 500
+# Rows changed by transactions still running when the synchronization starts are sent again the next time
+SAFETY_MARGIN = datetime.timedelta(minutes=5)
+
+
+def sync_models(app_label_models, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Send the objects changed since the last synchronization of the models in the list of tuple to the queue migration
+    :param app_label_models: A list of tuple, each tuple has app_label as key and a list of model_name as value
+    ex : [('base',['person', 'tutor', 'offer']),('dissertation',['offer_proposition', 'adviser'])]
+    :param batch_size: The number of objects read from the database at once
+    """
+    if hasattr(settings, 'QUEUES'):
+        queue_name = settings.QUEUES.get('QUEUES_NAME').get('MIGRATIONS_TO_PRODUCE')
+        print('Queue Name : {}'.format(queue_name))
+        print('Models : ')
+        for app_label, model_names in app_label_models:
+            print('  App label : {}'.format(app_label))
+            for model_name in model_names:
+                print('    Model : {}'.format(model_name))
+                try:
+                    model_class = apps.get_model(app_label=app_label, model_name=model_name)
+                    model_class._meta.get_field('changed')
+                except LookupError:
+                    print('   Model {} does not exists'.format(model_name))
+                    continue
+                except FieldDoesNotExist:
+                    print('   Model {} has no changed field'.format(model_name))
+                    continue
+                try:
+                    count = sync_model(model_class, queue_name, batch_size)
+                    print('    Count of objects sent : {}'.format(count))
+                except (ChannelClosed, ConnectionClosed):
+                    print('QueueServer is not installed or not launched')
+    else:
+        print('You have to configure queues to use synchronization script!')
+
+
+def sync_model(model_class, queue_name, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Send the objects of a model changed since its watermark, then store the new watermark.
+    :return: The number of objects sent
+    """
+    model_label = model_class._meta.label
+    watermark = sync_watermark.find_by_model_label(model_label) or \
+        sync_watermark.SyncWatermark(model_label=model_label)
+    sync_start = timezone.now()
+    last_syncs = sync_watermark.find_last_syncs()
+    last_changed = None
+    count = 0
+
+    connection = queue_sender.get_connection()
+    channel = queue_sender.get_channel(connection, queue_name)
+    if not channel:
+        raise ConnectionClosed()
+    try:
+        partitioning.declare_partition_queues(channel, queue_name)
+        for entity in _find_changed_since(model_class, watermark.last_sync, batch_size):
+            queue_sender.send_message(queue_name, wrap_serialization(serialize(entity, last_syncs=last_syncs)),
+                                      connection=connection, channel=channel, partition_key=entity.uuid)
+            if entity.changed and (not last_changed or entity.changed > last_changed):
+                last_changed = entity.changed
+            count += 1
+    finally:
+        channel.close()
+        connection.close()
+
+    if last_changed:
+        new_last_sync = min(last_changed, sync_start - SAFETY_MARGIN)
+        if not watermark.last_sync or new_last_sync > watermark.last_sync:
+            watermark.last_sync = new_last_sync
+            watermark.save()
+    return count
+
+
+def _find_changed_since(model_class, last_sync, batch_size):
+    """
+    Iterate over the objects changed since last_sync (all the objects if last_sync is None),
+    and the objects without changed date.
+    Objects are read by batches, paginated on the primary key, so that memory stays bounded.
+    """
+    query_set = model_class.objects.select_related().order_by('pk')
+    if last_sync:
+        query_set = query_set.filter(Q(changed__gt=last_sync) | Q(changed__isnull=True))
+    last_pk = None
+    while True:
+        batch_query_set = query_set.filter(pk__gt=last_pk) if last_pk is not None else query_set
+        batch = list(batch_query_set[:batch_size])
+        if not batch:
+            return
+        for entity in batch:
+            yield entity
+        last_pk = batch[-1].pk
@@ -68,7 +68,8 @@ def migrate_model(app_label_models):
                     try:
                         ser_obj = serialize(entity)
                         queue_sender.send_message(settings.QUEUES.get('QUEUES_NAME').get('MIGRATIONS_TO_PRODUCE'),
-                                                  wrap_serialization(ser_obj))
+                                                  wrap_serialization(ser_obj),
+                                                  partition_key=entity.uuid)
                     except (ChannelClosed, ConnectionClosed):
                         print('QueueServer is not installed or not launched')
     else:
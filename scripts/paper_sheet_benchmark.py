@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+##############################################################################
+#
+#    OSIS stands for Open Student Information System. It's an application
+#    designed to manage the core business of higher education institutions,
+#    such as universities, faculties, institutes and professional schools.
+#    The core business involves the administration of students, teachers,
+#    courses, programs and so on.
+#
+#    Copyright (C) 2015-2016 Université catholique de Louvain (http://www.uclouvain.be)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    A copy of this license - GNU General Public License - is available
+#    at the root of the source code of this program.  If not,
+#    see http://www.gnu.org/licenses/.
+#
+##############################################################################
+"""
+Benchmark of the rendering of the scores sheets (document/paper_sheet.py).
+Synthetic documents are rendered for several scenarios (number of learning units, programs by learning unit and
+enrollments by program). For each scenario, the script reports the pages rendered by second, the peak of the python
+memory allocations, the peak resident memory of the process and the time spent in the stages of the rendering
+(main_data, _write_table_of_students and doc.build). The rendering is done in the current process, without cache
+and without any queue or database access. The timed renderings are done without tracing the memory allocations
+(tracemalloc slows the allocations down) : the peak of the allocations is measured by one more rendering.
+The peak resident memory is the peak of the whole process since its start, not of the scenario alone.
+
+The results can be saved as a baseline (json file), then compared with the baseline after a change of the renderer :
+a scenario whose pages by second dropped more than the tolerance is reported as a regression.
+
+Usage
+cd BASE_DIR
+python3 manage.py shell
+from osis_common.scripts import paper_sheet_benchmark
+paper_sheet_benchmark.run(baseline_path='/tmp/paper_sheet_baseline.json', save_baseline=True)
+~ change the renderer ~
+paper_sheet_benchmark.run(baseline_path='/tmp/paper_sheet_baseline.json')
+"""
+import json
+import random
+import resource
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+from io import BytesIO
+
+from django.test import override_settings
+from PyPDF2 import PdfFileReader
+
+from osis_common.document import paper_sheet
+
+# (number of learning units, programs by learning unit, enrollments by program)
+DEFAULT_SCENARIOS = [(1, 1, 20),
+                     (1, 5, 100),
+                     (10, 3, 50),
+                     (2, 2, 2000)]
+DEFAULT_REPEAT = 3
+# A scenario is a regression if its pages by second dropped more than this ratio from the baseline
+DEFAULT_TOLERANCE = 0.1
+JUSTIFICATIONS = ['', '', '', 'absent', 'cheating', 'ill', 'justified_absence']
+STAGES = (('main_data', paper_sheet, 'main_data'),
+          ('_write_table_of_students', paper_sheet, '_write_table_of_students'),
+          ('doc.build', paper_sheet.SimpleDocTemplate, 'build'))
+
+
+def make_document(nb_learning_units, nb_programs, nb_enrollments, seed=0):
+    """
+    Make a synthetic document having the structure expected by paper_sheet.build_pdf.
+    """
+    randomizer = random.Random(seed)
+    return {'justification_legend': 'A : absent, T : cheating, M : ill, S : justified absence',
+            'learning_unit_years': [_make_learning_unit_year(randomizer, index, nb_programs, nb_enrollments)
+                                    for index in range(nb_learning_units)]}
+
+
+def _make_learning_unit_year(randomizer, index, nb_programs, nb_enrollments):
+    return {'acronym': 'LBENCH{:04d}'.format(index),
+            'title': 'Benchmark learning unit {}'.format(index),
+            'academic_year': '2016-2017',
+            'session_number': 1,
+            'decimal_scores': bool(index % 2),
+            'coordinator': {'last_name': 'Coordinator', 'first_name': 'Benchmark',
+                            'address': {'location': 'Place de l\'Université 1', 'postal_code': '1348',
+                                        'city': 'Louvain-la-Neuve'}},
+            'programs': [_make_program(randomizer, program_index, nb_enrollments)
+                         for program_index in range(nb_programs)]}
+
+
+def _make_program(randomizer, index, nb_enrollments):
+    return {'acronym': 'BENCH{}BA'.format(index),
+            'deadline': '15/06/2017',
+            'deliberation_date': '30/06/2017',
+            'address': {'recipient': 'Faculty secretariat', 'location': 'Place Montesquieu 2', 'postal_code': '1348',
+                        'city': 'Louvain-la-Neuve', 'phone': '010 47 00 00', 'fax': None,
+                        'email': 'secretariat@benchmark.org'},
+            'enrollments': [_make_enrollment(randomizer, number) for number in range(nb_enrollments)]}
+
+
+def _make_enrollment(randomizer, number):
+    return {'registration_id': '{:08d}'.format(number),
+            'last_name': 'Lastname' + 'x' * randomizer.randint(0, 40),
+            'first_name': 'Firstname' + 'y' * randomizer.randint(0, 20),
+            'score': str(randomizer.randint(0, 20)) if randomizer.random() < 0.7 else '',
+            'justification': randomizer.choice(JUSTIFICATIONS)}
+
+
+@contextmanager
+def _timed_stages(timings):
+    """
+    Replace the functions of the stages by wrappers adding their duration in timings during the benchmark.
+    """
+    originals = []
+    for stage, owner, attribute in STAGES:
+        original = getattr(owner, attribute)
+        originals.append((owner, attribute, original))
+        setattr(owner, attribute, _timed(stage, original, timings))
+    try:
+        yield
+    finally:
+        for owner, attribute, original in originals:
+            setattr(owner, attribute, original)
+
+
+def _timed(stage, function, timings):
+    def timed_function(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            timings[stage] += time.perf_counter() - start
+    return timed_function
+
+
+def benchmark_scenario(nb_learning_units, nb_programs, nb_enrollments, repeat=DEFAULT_REPEAT):
+    """
+    Render the document of a scenario repeat times, then once more to measure the peak of the memory allocations.
+    :return: A dict with the results of the scenario (the best duration of the repetitions is kept)
+    """
+    document = make_document(nb_learning_units, nb_programs, nb_enrollments)
+    best_duration = None
+    best_timings = None
+    with override_settings(PAPER_SHEET_CACHE_DIR=None):
+        for _ in range(repeat):
+            timings = defaultdict(float)
+            start = time.perf_counter()
+            with _timed_stages(timings):
+                pdf = paper_sheet.build_pdf(document, workers=1)
+            duration = time.perf_counter() - start
+            if best_duration is None or duration < best_duration:
+                best_duration = duration
+                best_timings = timings
+        tracemalloc.start()
+        try:
+            paper_sheet.build_pdf(document, workers=1)
+            current, peak_allocated = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    nb_pages = PdfFileReader(BytesIO(pdf)).getNumPages()
+    return {'scenario': _get_scenario_name(nb_learning_units, nb_programs, nb_enrollments),
+            'pages': nb_pages,
+            'duration': best_duration,
+            'pages_per_second': nb_pages / best_duration,
+            'peak_allocated_kb': peak_allocated // 1024,
+            # Peak of the whole process since its start, including the previous scenarios (kilobytes on Linux)
+            'process_peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            'stages': dict(best_timings)}
+
+
+def _get_scenario_name(nb_learning_units, nb_programs, nb_enrollments):
+    return '{}lu_{}pr_{}en'.format(nb_learning_units, nb_programs, nb_enrollments)
+
+
+def run(scenarios=DEFAULT_SCENARIOS, repeat=DEFAULT_REPEAT, baseline_path=None, save_baseline=False,
+        tolerance=DEFAULT_TOLERANCE):
+    """
+    Run the benchmark and print its results.
+    :param scenarios: A list of tuple (number of learning units, programs by learning unit, enrollments by program)
+    :param repeat: The number of renderings of each scenario
+    :param baseline_path: The path of the json file of the baseline
+    :param save_baseline: If True, the results are saved as the baseline, else they are compared with the baseline
+    :param tolerance: The ratio of pages by second lost from the baseline above which a scenario is a regression
+    :return: The list of the results of the scenarios
+    """
+    results = []
+    for scenario in scenarios:
+        result = benchmark_scenario(*scenario, repeat=repeat)
+        results.append(result)
+        _print_result(result)
+    if baseline_path and save_baseline:
+        with open(baseline_path, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=2)
+        print('Baseline saved in {}'.format(baseline_path))
+    elif baseline_path:
+        with open(baseline_path) as baseline_file:
+            baseline = {result['scenario']: result for result in json.load(baseline_file)}
+        compare(results, baseline, tolerance)
+    return results
+
+
+def _print_result(result):
+    print('Scenario : {}'.format(result['scenario']))
+    print('    Pages : {} in {:.3f} s ({:.1f} pages/s)'.format(result['pages'], result['duration'],
+                                                              result['pages_per_second']))
+    print('    Peak allocated : {} KB - Peak RSS of the process : {} KB'.format(result['peak_allocated_kb'],
+                                                                             result['process_peak_rss_kb']))
+    for stage, duration in sorted(result['stages'].items()):
+        print('    {} : {:.3f} s'.format(stage, duration))
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Print the comparison of the results with the baseline.
+    :return: The list of the scenarios in regression
+    """
+    regressions = []
+    for result in results:
+        baseline_result = baseline.get(result['scenario'])
+        if not baseline_result:
+            print('{} : not in the baseline'.format(result['scenario']))
+            continue
+        ratio = result['pages_per_second'] / baseline_result['pages_per_second']
+        memory_ratio = result['peak_allocated_kb'] / max(baseline_result['peak_allocated_kb'], 1)
+        regression = ratio < 1 - tolerance
+        if regression:
+            regressions.append(result['scenario'])
+        print('{} : {:+.1%} pages/s, {:+.1%} peak allocated{}'.format(result['scenario'], ratio - 1,
+                                                                      memory_ratio - 1,
+                                                                      ' REGRESSION' if regression else ''))
+    return regressions
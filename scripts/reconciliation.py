@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+##############################################################################
+#
+#    OSIS stands for Open Student Information System. It's an application
+#    designed to manage the core business of higher education institutions,
+#    such as universities, faculties, institutes and professional schools.
+#    The core business involves the administration of students, teachers,
+#    courses, programs and so on.
+#
+#    Copyright (C) 2015-2016 Université catholique de Louvain (http://www.uclouvain.be)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    A copy of this license - GNU General Public License - is available
+#    at the root of the source code of this program.  If not,
+#    see http://www.gnu.org/licenses/.
+#
+##############################################################################
+"""
+This script is used to reconcile the data of serializable models between osis and osis-portal,
+without sending all the data again (as initial_migration does).
+The uuids of a model are split in buckets (ranges of uuids). Each side computes a hash by bucket, over the digests
+of the serialized rows of the bucket (Merkle-style). The rows are read in the order of their uuid, bucket by bucket,
+so that only the digests of one bucket are kept in memory at once.
+The producer asks the consumer for its bucket hashes (request/reply over the queue), then for the row digests
+of the mismatching buckets only, and finally sends in the migration queue the rows which differ or are missing
+on the consumer side, and the deletion of the rows it does not have.
+
+The consumer has to answer the requests of the reconciliation queue :
+~ queue_listener.listen_queue(settings.QUEUES.get('QUEUES_NAME').get('RECONCILIATION'), reconciliation.answer_request)
+
+ex reconciliation of persons from osis:
+(VENV) cd /path/to/osis
+(VENV) python3 manage.py shell
+~ from osis_common.scripts import reconciliation
+~ reconciliation.reconcile_models([('base', ['person'])])
+"""
+import hashlib
+import json
+import uuid
+
+from django.apps import apps
+from django.conf import settings
+from pika.exceptions import ChannelClosed, ConnectionClosed
+from osis_common.models.serializable_model import serialize, wrap_serialization
+from osis_common.queue import queue_sender, partitioning
+from osis_common.queue.queue_listener import RpcClient
+
+NB_BUCKETS = 1024
+UUID_SPACE = 2 ** 128
+# Fields which legitimately differ between the producer and the consumer
+EXCLUDED_FIELDS = ('id', 'changed', 'user')
+
+
+def get_bucket(row_uuid):
+    """
+    The buckets are ranges of uuids : the rows ordered by uuid are ordered by bucket.
+    """
+    return int(str(row_uuid).replace('-', ''), 16) * NB_BUCKETS // UUID_SPACE
+
+
+def __get_bucket_start(bucket):
+    """
+    :return: The first uuid (as an int) of a bucket
+    """
+    return -(-bucket * UUID_SPACE // NB_BUCKETS)
+
+
+def get_row_digest(entity):
+    """
+    Digest of the serialized fields of an object, nested objects being represented by their uuid.
+    """
+    fields = serialize(entity).get('fields')
+    normalized = {name: value.get('fields').get('uuid') if isinstance(value, dict) else value
+                  for name, value in fields.items() if name not in EXCLUDED_FIELDS}
+    return hashlib.sha1(json.dumps(normalized, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def iter_row_digests(model_class, buckets=None):
+    """
+    Compute the row digests bucket by bucket, reading the rows in the order of their uuid.
+    :param buckets: The buckets to compute. All the buckets if None
+    :return: A generator of tuple (bucket, list of tuple (uuid, digest) ordered by uuid)
+    """
+    queryset = model_class.objects.select_related().order_by('uuid')
+    if buckets is None:
+        querysets = [queryset]
+    else:
+        querysets = [__filter_bucket(queryset, bucket) for bucket in sorted(buckets)]
+    for bucket_queryset in querysets:
+        current_bucket = None
+        digests = []
+        for entity in bucket_queryset.iterator():
+            bucket = get_bucket(entity.uuid)
+            if bucket != current_bucket:
+                if digests:
+                    yield current_bucket, digests
+                current_bucket = bucket
+                digests = []
+            digests.append((str(entity.uuid), get_row_digest(entity)))
+        if digests:
+            yield current_bucket, digests
+
+
+def __filter_bucket(queryset, bucket):
+    queryset = queryset.filter(uuid__gte=uuid.UUID(int=__get_bucket_start(bucket)))
+    if bucket + 1 < NB_BUCKETS:
+        queryset = queryset.filter(uuid__lt=uuid.UUID(int=__get_bucket_start(bucket + 1)))
+    return queryset
+
+
+def compute_bucket_hashes(row_digests):
+    """
+    :param row_digests: The row digests bucket by bucket, as generated by iter_row_digests
+    :return: A dict bucket: hash of the bucket
+    """
+    return {bucket: hashlib.sha1(''.join('{}:{};'.format(row_uuid, digest)
+                                         for row_uuid, digest in sorted(digests)).encode('utf-8')).hexdigest()
+            for bucket, digests in row_digests}
+
+
+def answer_request(json_data):
+    """
+    Callback of the consumer of the reconciliation queue.
+    The request {'model': label} is answered with the bucket hashes of the model ;
+    the request {'model': label, 'buckets': [...]} is answered with the row digests of these buckets.
+    """
+    request = json.loads(json_data.decode("utf-8"))
+    model_class = apps.get_model(request.get('model'))
+    buckets = request.get('buckets')
+    if buckets is None:
+        response = {'bucket_hashes': compute_bucket_hashes(iter_row_digests(model_class))}
+    else:
+        response = {'digests': __get_digests(model_class, buckets)}
+    return json.dumps(response)
+
+
+def __get_digests(model_class, buckets):
+    """
+    :return: A dict uuid: digest of the rows of the buckets
+    """
+    return {row_uuid: digest for bucket, digests in iter_row_digests(model_class, buckets)
+            for row_uuid, digest in digests}
+
+
+def reconcile_models(app_label_models):
+    """
+    Reconcile the models in the list of tuple with the consumer
+    :param app_label_models: A list of tuple, each tuple has app_label as key and a list of model_name as value
+    ex : [('base',['person', 'tutor', 'offer']),('dissertation',['offer_proposition', 'adviser'])]
+    """
+    if hasattr(settings, 'QUEUES'):
+        queues_name = settings.QUEUES.get('QUEUES_NAME')
+        print('Queue Name : {}'.format(queues_name.get('MIGRATIONS_TO_PRODUCE')))
+        print('Models : ')
+        try:
+            client = RpcClient(queues_name.get('RECONCILIATION'))
+        except (ChannelClosed, ConnectionClosed):
+            print('QueueServer is not installed or not launched')
+            return
+        try:
+            for app_label, model_names in app_label_models:
+                print('  App label : {}'.format(app_label))
+                for model_name in model_names:
+                    print('    Model : {}'.format(model_name))
+                    try:
+                        model_class = apps.get_model(app_label=app_label, model_name=model_name)
+                    except LookupError:
+                        print('   Model {} does not exists'.format(model_name))
+                        continue
+                    sent, deleted = reconcile_model(model_class, client, queues_name.get('MIGRATIONS_TO_PRODUCE'))
+                    print('    Count of objects sent : {} - deleted : {}'.format(sent, deleted))
+        finally:
+            client.close()
+    else:
+        print('You have to configure queues to use reconciliation script!')
+
+
+def reconcile_model(model_class, client, queue_name):
+    """
+    Send to the consumer the objects of a model which are in mismatching buckets.
+    :return: A tuple (count of objects sent, count of objects deleted)
+    """
+    label = model_class._meta.label
+    local_hashes = compute_bucket_hashes(iter_row_digests(model_class))
+    remote_hashes = json.loads(client.call(json.dumps({'model': label})).decode("utf-8")).get('bucket_hashes')
+    remote_hashes = {int(bucket): bucket_hash for bucket, bucket_hash in remote_hashes.items()}
+    mismatching_buckets = [bucket for bucket in set(local_hashes) | set(remote_hashes)
+                           if local_hashes.get(bucket) != remote_hashes.get(bucket)]
+    if not mismatching_buckets:
+        return 0, 0
+
+    remote_digests = json.loads(client.call(json.dumps({'model': label, 'buckets': mismatching_buckets}))
+                                .decode("utf-8")).get('digests')
+    local_digests = __get_digests(model_class, mismatching_buckets)
+    uuids_to_send = [row_uuid for row_uuid, digest in local_digests.items() if remote_digests.get(row_uuid) != digest]
+    uuids_to_delete = [row_uuid for row_uuid in remote_digests if row_uuid not in local_digests]
+
+    connection = queue_sender.get_connection()
+    channel = queue_sender.get_channel(connection, queue_name)
+    if not channel:
+        raise ConnectionClosed()
+    try:
+        partitioning.declare_partition_queues(channel, queue_name)
+        for entity in model_class.objects.select_related().filter(uuid__in=uuids_to_send).iterator():
+            queue_sender.send_message(queue_name, wrap_serialization(serialize(entity)),
+                                      connection=connection, channel=channel, partition_key=entity.uuid)
+        for row_uuid in uuids_to_delete:
+            queue_sender.send_message(queue_name,
+                                      wrap_serialization({'model': label, 'fields': {'uuid': row_uuid}},
+                                                         to_delete=True),
+                                      connection=connection, channel=channel, partition_key=row_uuid)
+    finally:
+        channel.close()
+        connection.close()
+    return len(uuids_to_send), len(uuids_to_delete)
@@ -23,19 +23,29 @@
 #    see http://www.gnu.org/licenses/.
 #
 ##############################################################################
+from datetime import timedelta
+
 from django.conf import settings
-from django.test import TestCase
+from django.core import mail
+from django.test import TestCase, override_settings
+from django.utils import timezone
 from osis_common.messaging.send_message import send_again
 from osis_common.models import message_history
 from osis_common.messaging import send_message
 from osis_common.messaging.message_config import create_receiver, create_table, create_message_content
 from osis_common.models.message_template import MessageTemplate
+from osis_common.messaging import template_cache
+from osis_common.messaging.mail_sender import MailSender
 
 
 class MessagesTestCase(TestCase):
 
     fixtures = ['osis_common/fixtures/messages_tests.json']
 
+    def setUp(self):
+        template_cache.clear()
+        self.addCleanup(template_cache.clear)
+
     def test_get_all_lang_templates(self):
         txt_message_templates, html_message_templates = send_message._get_all_lang_templates(
             ['assessments_scores_submission_html',
@@ -129,6 +139,141 @@ class MessagesTestCase(TestCase):
         self.assertTrue(count_messages_after_send_again == count_messages_before_send_again + 1,
                         'It should be {} messges in messages history'.format(count_messages_before_send_again + 1))
 
+    def test_send_personalized_messages(self):
+        count_messages_before_send = message_history.MessageHistory.objects.count()
+        receivers = [create_receiver(receiver.get('receiver_id'), receiver.get('receiver_email'),
+                                     receiver.get('receiver_lang'),
+                                     {'learning_unit_name': 'LU{}'.format(receiver.get('receiver_id'))})
+                     for receiver in self.__make_receivers()]
+        message_content = create_message_content('assessments_scores_submission_html',
+                                                 'assessments_scores_submission_txt',
+                                                 (self.__make_table(),),
+                                                 receivers,
+                                                 {'learning_unit_name': 'DROI1100'},
+                                                 None)
+        message_error = send_message.send_personalized_messages(message_content,
+                                                                   mail_sender=MailSender(batch_size=2))
+        self.assertIsNone(message_error, 'No message error should be sent')
+        self.assertEqual(message_history.MessageHistory.objects.count(), count_messages_before_send + 5,
+                         '5 messages should have been sent')
+        self.assertEqual(len(mail.outbox), 5, 'One mail by receiver')
+        for email in mail.outbox:
+            self.assertEqual(len(email.to), 1)
+
+    @override_settings(EMAIL_PRODUCTION_SENDING=False)
+    def test_send_personalized_messages_receiver_without_email(self):
+        receivers = [create_receiver(1000, None, 'fr-BE'), create_receiver(1001, 'receiver@email.org', 'fr-BE')]
+        message_content = create_message_content('assessments_scores_submission_html',
+                                                 'assessments_scores_submission_txt',
+                                                 (self.__make_table(),),
+                                                 receivers,
+                                                 {'learning_unit_name': 'DROI1100'},
+                                                 None)
+        send_message.send_personalized_messages(message_content)
+        self.assertIsNone(message_history.MessageHistory.objects.get(receiver_id=1000).sent)
+        self.assertIsNotNone(message_history.MessageHistory.objects.get(receiver_id=1001).sent)
+
+    @override_settings(MESSAGE_HISTORY_SHARED_CONTENT=True)
+    def test_send_messages_with_shared_content(self):
+        count_contents_before_send = message_history.MessageContent.objects.count()
+        message_content = create_message_content('assessments_scores_submission_html',
+                                                 'assessments_scores_submission_txt',
+                                                 (self.__make_table(),),
+                                                 self.__make_receivers(),
+                                                 {'learning_unit_name': 'DROI1100'},
+                                                 None)
+        send_message.send_messages(message_content)
+        # One content by language of the receivers
+        self.assertEqual(message_history.MessageContent.objects.count(), count_contents_before_send + 2)
+        for message in message_history.MessageHistory.objects.filter(message_content__isnull=False):
+            self.assertEqual(message.content_html, '')
+            self.assertEqual(message.get_content_html(), message.message_content.content_html)
+
+    def test_compiled_template_cache(self):
+        message_template = MessageTemplate.objects.filter(reference='assessments_scores_submission_html').first()
+        compiled_template = template_cache.get_compiled_template(message_template)
+        self.assertIs(template_cache.get_compiled_template(message_template), compiled_template)
+        message_template.template = '<p>{{ learning_unit_name }}</p>'
+        message_template.save()
+        self.assertIsNot(template_cache.get_compiled_template(message_template), compiled_template)
+
+    def test_find_my_messages_page(self):
+        sent = timezone.now()
+        message_history.create_message_histories([
+            message_history.MessageHistory(subject='subject', content_txt='txt', content_html='html',
+                                           receiver_id=1000, sent=None if i == 4 else sent - timedelta(days=i // 2))
+            for i in range(5)])
+        expected_ids = [message.id for message in message_history.find_my_messages(1000)]
+        page_ids = []
+        after_message_id = None
+        while True:
+            page = message_history.find_my_messages_page(1000, after_message_id, page_size=2)
+            if not page:
+                break
+            page_ids.extend(message.id for message in page)
+            after_message_id = page[-1].id
+        self.assertCountEqual(page_ids, expected_ids)
+        self.assertEqual(len(page_ids), 5)
+        self.assertEqual(message_history.count_my_unread_messages(1000), 5)
+
+    def test_send_again_many(self):
+        count_messages_before_send_again = message_history.MessageHistory.objects.count()
+        message = message_history.MessageHistory.objects.get(id=1)
+        resends = [(create_receiver(receiver_id, 'receiver{}@email.org'.format(receiver_id), 'fr-BE'), message.id)
+                   for receiver_id in range(1, 6)]
+        resends.append((create_receiver(6, 'receiver6@email.org', 'fr-BE'), 0))
+        # A receiver without email is saved in history, but not counted as sent
+        resends.append((create_receiver(7, None, 'fr-BE'), message.id))
+        self.assertEqual(send_message.send_again_many(resends, MailSender(batch_size=2)), 5)
+        self.assertEqual(message_history.MessageHistory.objects.count(), count_messages_before_send_again + 6)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(mail.outbox[0].subject, message.subject)
+
+    def test_send_again_archived_message(self):
+        message = message_history.MessageHistory.objects.get(id=1)
+        message_history.MessageHistory.objects.filter(id=1).update(created=timezone.now() - timedelta(days=400))
+        self.assertGreaterEqual(message_history.archive_message_histories(retention_days=365, batch_size=1), 1)
+        self.assertFalse(message_history.MessageHistory.objects.filter(id=1).exists())
+        archived_message = message_history.find_by_id(1)
+        self.assertEqual(archived_message.get_content_txt(), message.get_content_txt())
+        self.assertEqual(archived_message.get_content_html(), message.get_content_html())
+        send_again(create_receiver(message.receiver_id, 'receiver@email.org', 'fr-BE'), 1)
+        self.assertEqual(len(mail.outbox), 1)
+
+    @override_settings(MESSAGE_HISTORY_SHARED_CONTENT=True)
+    def test_archive_deletes_unused_contents(self):
+        message_histories = message_history.create_message_histories([
+            message_history.MessageHistory(subject='subject', content_txt=content, content_html=content,
+                                           receiver_id=receiver_id)
+            for receiver_id, content in ((1000, 'shared'), (1001, 'shared'), (1002, 'alone'))])
+        shared_content_id, alone_content_id = message_histories[0].message_content_id, \
+            message_histories[2].message_content_id
+        message_history.MessageHistory.objects.filter(receiver_id__in=(1000, 1002))\
+                                              .update(created=timezone.now() - timedelta(days=400))
+        message_history.archive_message_histories(retention_days=365)
+        self.assertTrue(message_history.MessageContent.objects.filter(id=shared_content_id).exists())
+        self.assertFalse(message_history.MessageContent.objects.filter(id=alone_content_id).exists())
+        self.assertEqual(message_history.find_by_id(message_histories[2].id).get_content_txt(), 'alone')
+
+    def test_templates_registry(self):
+        references = ['assessments_scores_submission_html', 'assessments_scores_submission_txt']
+        template_cache.get_templates_by_language(references)
+        with self.assertNumQueries(0):
+            html_message_templates, txt_message_templates = send_message._get_all_lang_templates(references)
+        message_template = html_message_templates.get(settings.LANGUAGE_CODE)
+        message_template.subject = 'New subject'
+        message_template.save()
+        html_message_templates, txt_message_templates = send_message._get_all_lang_templates(references)
+        self.assertEqual(html_message_templates.get(settings.LANGUAGE_CODE).subject, 'New subject')
+
+    def test_templates_registry_returns_copies(self):
+        references = ['assessments_scores_submission_html']
+        message_template = template_cache.get_templates_by_language(references)[0].get(settings.LANGUAGE_CODE)
+        subject = message_template.subject
+        message_template.subject = 'Modified subject'
+        self.assertEqual(template_cache.get_templates_by_language(references)[0].get(settings.LANGUAGE_CODE).subject,
+                         subject)
+
     def __make_receivers(self):
         receiver1 = create_receiver(1, 'receiver1@email.org', 'fr-BE')
         receiver2 = create_receiver(2, 'receiver2@email.org', 'fr-BE')
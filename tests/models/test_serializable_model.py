@@ -24,9 +24,11 @@
 #
 ##############################################################################
 import json
+from django.conf import settings
 from django.test.testcases import TestCase
 from osis_common.models.exception import MultipleModelsSerializationException
-from osis_common.models.serializable_model import serialize_objects, format_data_for_migration
+from osis_common.models.serializable_model import serialize_objects, format_data_for_migration, serialize, persist, \
+    get_schema_id
 from osis_common.tests.models_for_tests.serializable_tests_models import ModelWithoutUser, \
     ModelWithUser
 
@@ -82,3 +84,50 @@ class TestFormatDataForMigration(TestCase):
         object_to_format = [self.model_with_user]
         formated_objects = format_data_for_migration(object_to_format, to_delete=False)
         self.assertFalse(formated_objects.get('to_delete'))
+
+
+class TestPersist(TestCase):
+
+    def test_persist_new_object(self):
+        structure = serialize(ModelWithoutUser(name='Without User', uuid='daf86b06-b784-4e02-9131-3098da60506c'))
+        persisted_id = persist(structure)
+        model = ModelWithoutUser.find_by_id(persisted_id)
+        self.assertIsNotNone(model)
+        self.assertEqual(model.name, 'Without User')
+
+    def test_persist_existing_object(self):
+        model = ModelWithoutUser(name='Before Update', uuid='daf86b06-b784-4e02-9131-3098da60506c')
+        model.save()
+        structure = serialize(ModelWithoutUser(name='After Update', uuid='daf86b06-b784-4e02-9131-3098da60506c'))
+        persisted_id = persist(structure)
+        self.assertEqual(persisted_id, model.id)
+        self.assertEqual(ModelWithoutUser.find_by_id(model.id).name, 'After Update')
+        self.assertEqual(ModelWithoutUser.objects.count(), 1)
+
+    def test_persist_keeps_fields_not_received(self):
+        model = ModelWithUser(name='Before Update', uuid='c03a1839-6eb3-4565-b256-e0aea5ec8437', user='user1')
+        model.save()
+        structure = serialize(ModelWithUser(name='After Update', uuid='c03a1839-6eb3-4565-b256-e0aea5ec8437'))
+        del structure['fields']['user']
+        persist(structure)
+        model = ModelWithUser.find_by_id(model.id)
+        self.assertEqual(model.name, 'After Update')
+        self.assertEqual(model.user, 'user1')
+
+
+class TestWireSchema(TestCase):
+
+    def test_schema_id_sent_with_serialization(self):
+        structure = serialize(ModelWithoutUser(name='Without User'))
+        self.assertEqual(structure.get('schema'), get_schema_id(ModelWithoutUser))
+
+    def test_schema_id_depends_on_fields(self):
+        self.assertNotEqual(get_schema_id(ModelWithUser), get_schema_id(ModelWithoutUser))
+
+    def test_persist_with_drifted_schema(self):
+        structure = serialize(ModelWithoutUser(name='Without User', uuid='daf86b06-b784-4e02-9131-3098da60506c'))
+        structure['schema'] = 'drifted'
+        structure['fields']['unknown_field'] = 'value'
+        with self.assertLogs(settings.DEFAULT_LOGGER, level='WARNING'):
+            persisted_id = persist(structure)
+        self.assertEqual(ModelWithoutUser.find_by_id(persisted_id).name, 'Without User')
@@ -24,7 +24,7 @@
 #
 ##############################################################################
 from django.core.exceptions import ObjectDoesNotExist
-from django.db.models.fields import CharField
+from django.db.models.fields import CharField, DateTimeField
 from osis_common.models.serializable_model import SerializableModel
 
 
@@ -62,4 +62,9 @@ class ModelWithoutUser(SerializableModel):
         try:
             return ModelWithoutUser.objects.get(id=id)
         except ObjectDoesNotExist:
-            return None
\ No newline at end of file
+            return None
+
+
+class ModelWithChanged(SerializableModel):
+    name = CharField(max_length=30, unique=True)
+    changed = DateTimeField(null=True, auto_now=True)
@@ -0,0 +1,63 @@
+##############################################################################
+#
+#    OSIS stands for Open Student Information System. It's an application
+#    designed to manage the core business of higher education institutions,
+#    such as universities, faculties, institutes and professional schools.
+#    The core business involves the administration of students, teachers,
+#    courses, programs and so on.
+#
+#    Copyright (C) 2015-2016 Université catholique de Louvain (http://www.uclouvain.be)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    A copy of this license - GNU General Public License - is available
+#    at the root of the source code of this program.  If not,
+#    see http://www.gnu.org/licenses/.
+#
+##############################################################################
+import uuid
+
+from django.test import SimpleTestCase, override_settings
+from osis_common.queue import partitioning
+
+QUEUES = {'QUEUES_PARTITIONS': {'partitioned_queue': 4}}
+
+
+@override_settings(QUEUES=QUEUES)
+class TestPartitioning(SimpleTestCase):
+
+    def setUp(self):
+        self.keys = [uuid.uuid4() for _ in range(1000)]
+
+    def test_partition_in_range(self):
+        for key in self.keys:
+            self.assertIn(partitioning.get_partition(key, 4), range(4))
+
+    def test_partition_stable(self):
+        for key in self.keys:
+            self.assertEqual(partitioning.get_partition(key, 4), partitioning.get_partition(str(key), 4))
+
+    def test_few_keys_move_when_adding_partition(self):
+        moved = [key for key in self.keys if partitioning.get_partition(key, 4) != partitioning.get_partition(key, 5)]
+        # About 1/5 of the keys move, and only to the new partition
+        self.assertLess(len(moved), len(self.keys) / 3)
+        for key in moved:
+            self.assertEqual(partitioning.get_partition(key, 5), 4)
+
+    def test_route_partitioned_queue(self):
+        key = self.keys[0]
+        queue_name = partitioning.route('partitioned_queue', key)
+        self.assertEqual(queue_name, 'partitioned_queue_{}'.format(partitioning.get_partition(key, 4)))
+        self.assertIn(queue_name, partitioning.get_partition_queue_names('partitioned_queue'))
+
+    def test_route_not_partitioned_queue(self):
+        self.assertEqual(partitioning.route('other_queue', self.keys[0]), 'other_queue')
+        self.assertEqual(partitioning.route('partitioned_queue', None), 'partitioned_queue')
@@ -0,0 +1,79 @@
+##############################################################################
+#
+#    OSIS stands for Open Student Information System. It's an application
+#    designed to manage the core business of higher education institutions,
+#    such as universities, faculties, institutes and professional schools.
+#    The core business involves the administration of students, teachers,
+#    courses, programs and so on.
+#
+#    Copyright (C) 2015-2016 Université catholique de Louvain (http://www.uclouvain.be)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    A copy of this license - GNU General Public License - is available
+#    at the root of the source code of this program.  If not,
+#    see http://www.gnu.org/licenses/.
+#
+##############################################################################
+import datetime
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+
+from osis_common.models import sync_watermark
+from osis_common.scripts import delta_sync
+from osis_common.tests.models_for_tests.serializable_tests_models import ModelWithChanged
+
+
+class DeltaSyncTest(TestCase):
+
+    def setUp(self):
+        # The messages are captured instead of being sent to the queue server
+        patchers = [mock.patch('osis_common.queue.queue_sender.get_connection'),
+                    mock.patch('osis_common.queue.queue_sender.get_channel'),
+                    mock.patch('osis_common.queue.partitioning.declare_partition_queues')]
+        send_message_patcher = mock.patch('osis_common.queue.queue_sender.send_message')
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.send_message = send_message_patcher.start()
+        self.addCleanup(send_message_patcher.stop)
+        # Created in bulk : the save of a serializable model sends it to the queue server
+        ModelWithChanged.objects.bulk_create([ModelWithChanged(name='Old'),
+                                              ModelWithChanged(name='Recent'),
+                                              ModelWithChanged(name='Without changed')])
+        now = timezone.now()
+        ModelWithChanged.objects.filter(name='Old').update(changed=now - datetime.timedelta(days=2))
+        ModelWithChanged.objects.filter(name='Recent').update(changed=now - datetime.timedelta(days=1))
+        ModelWithChanged.objects.filter(name='Without changed').update(changed=None)
+
+    def _sync(self):
+        self.send_message.reset_mock()
+        count = delta_sync.sync_model(ModelWithChanged, 'migrations')
+        sent_uuids = {call[1].get('partition_key') for call in self.send_message.call_args_list}
+        self.assertEqual(count, len(sent_uuids))
+        return {entity.name for entity in ModelWithChanged.objects.filter(uuid__in=sent_uuids)}
+
+    def _get_watermark(self):
+        return sync_watermark.find_by_model_label(ModelWithChanged._meta.label).last_sync
+
+    def test_first_sync_sends_all(self):
+        self.assertEqual(self._sync(), {'Old', 'Recent', 'Without changed'})
+        self.assertEqual(self._get_watermark(), ModelWithChanged.objects.get(name='Recent').changed)
+
+    def test_sync_sends_changed_since_watermark(self):
+        self._sync()
+        first_watermark = self._get_watermark()
+        ModelWithChanged.objects.filter(name='Old').update(changed=timezone.now() - datetime.timedelta(hours=1))
+        self.assertEqual(self._sync(), {'Old', 'Without changed'})
+        self.assertGreater(self._get_watermark(), first_watermark)
+        self.assertEqual(self._sync(), {'Without changed'})
@@ -0,0 +1,117 @@
+##############################################################################
+#
+#    OSIS stands for Open Student Information System. It's an application
+#    designed to manage the core business of higher education institutions,
+#    such as universities, faculties, institutes and professional schools.
+#    The core business involves the administration of students, teachers,
+#    courses, programs and so on.
+#
+#    Copyright (C) 2015-2016 Université catholique de Louvain (http://www.uclouvain.be)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    A copy of this license - GNU General Public License - is available
+#    at the root of the source code of this program.  If not,
+#    see http://www.gnu.org/licenses/.
+#
+##############################################################################
+import json
+import smtplib
+from unittest import mock
+
+from django.core import mail
+from django.core.mail import EmailMultiAlternatives
+from django.core.mail.backends.base import BaseEmailBackend
+from django.test import TestCase, SimpleTestCase, override_settings
+from pika.exceptions import ConnectionClosed
+
+from osis_common.messaging import mail_queue
+from osis_common.models import message_history
+
+
+class FailingEmailBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise smtplib.SMTPException('Mail server error')
+
+
+def _make_email(to=('receiver@email.org', )):
+    email = EmailMultiAlternatives('Subject', 'Body', 'from@email.org', list(to),
+                                   attachments=[('scores.csv', b'\x00binary', 'text/csv'),
+                                                ('notes.txt', 'text', 'text/plain')])
+    email.attach_alternative('<p>Body</p>', 'text/html')
+    return email
+
+
+def _to_queue_message(data):
+    return json.dumps(data).encode('utf-8')
+
+
+class SerializeEmailTest(SimpleTestCase):
+
+    def test_round_trip(self):
+        email = _make_email()
+        data = json.loads(json.dumps(mail_queue.serialize_email(email, [])))
+        deserialized_email = mail_queue.deserialize_email(data)
+        self.assertEqual(deserialized_email.subject, email.subject)
+        self.assertEqual(deserialized_email.body, email.body)
+        self.assertEqual(deserialized_email.from_email, email.from_email)
+        self.assertEqual(deserialized_email.to, email.to)
+        self.assertEqual([tuple(alternative) for alternative in deserialized_email.alternatives], email.alternatives)
+        self.assertEqual(deserialized_email.attachments, email.attachments)
+
+
+class QueueMailSenderTest(SimpleTestCase):
+
+    def test_queue_server_not_available(self):
+        with mock.patch('osis_common.queue.queue_sender.get_connection', return_value=None), \
+                self.assertRaises(ConnectionClosed):
+            with mail_queue.QueueMailSender():
+                pass
+
+
+@override_settings(EMAIL_RATE_LIMITS=None, EMAIL_QUEUE_MAX_ATTEMPTS=3)
+class ProcessMessageTest(TestCase):
+
+    def setUp(self):
+        # The mail sender of the worker is kept by thread
+        mail_queue._worker_data.__dict__.clear()
+        self.message_history = message_history.create_message_histories([
+            message_history.MessageHistory(subject='Subject', content_txt='Body', content_html='<p>Body</p>',
+                                           receiver_id=1000)])[0]
+
+    def test_sent(self):
+        mail_queue.process_message(_to_queue_message(mail_queue.serialize_email(_make_email(),
+                                                                                [self.message_history])))
+        self.assertEqual(len(mail.outbox), 1)
+        self.message_history.refresh_from_db()
+        self.assertIsNotNone(self.message_history.sent)
+
+    def test_email_without_recipients_not_set_sent(self):
+        mail_queue.process_message(_to_queue_message(mail_queue.serialize_email(_make_email(to=()),
+                                                                                [self.message_history])))
+        self.message_history.refresh_from_db()
+        self.assertIsNone(self.message_history.sent)
+
+    @override_settings(EMAIL_BACKEND='osis_common.tests.test_mail_queue.FailingEmailBackend')
+    def test_failure_retried_later(self):
+        data = mail_queue.serialize_email(_make_email(), [self.message_history])
+        with mock.patch('osis_common.messaging.mail_queue.__publish') as publish:
+            mail_queue.process_message(_to_queue_message(data))
+        publish.assert_called_once_with(dict(data, attempts=1), delay=2)
+        self.message_history.refresh_from_db()
+        self.assertIsNone(self.message_history.sent)
+
+    @override_settings(EMAIL_BACKEND='osis_common.tests.test_mail_queue.FailingEmailBackend')
+    def test_failure_not_retried_after_max_attempts(self):
+        data = mail_queue.serialize_email(_make_email(), [self.message_history], attempts=2)
+        with mock.patch('osis_common.messaging.mail_queue.__publish') as publish:
+            mail_queue.process_message(_to_queue_message(data))
+        publish.assert_not_called()
@@ -0,0 +1,82 @@
+##############################################################################
+#
+#    OSIS stands for Open Student Information System. It's an application
+#    designed to manage the core business of higher education institutions,
+#    such as universities, faculties, institutes and professional schools.
+#    The core business involves the administration of students, teachers,
+#    courses, programs and so on.
+#
+#    Copyright (C) 2015-2016 Université catholique de Louvain (http://www.uclouvain.be)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    A copy of this license - GNU General Public License - is available
+#    at the root of the source code of this program.  If not,
+#    see http://www.gnu.org/licenses/.
+#
+##############################################################################
+import smtplib
+
+from django.core.mail import EmailMessage
+from django.test import SimpleTestCase
+
+from osis_common.messaging.mail_sender import MailSender
+
+
+class FailingConnection(object):
+    """
+    Email backend failing once when sending the email number fail_at (first call only).
+    """
+    def __init__(self, fail_at, error):
+        self.fail_at = fail_at
+        self.error = error
+        self.failed = False
+        self.sent = []
+        self.opened = 0
+
+    def open(self):
+        self.opened += 1
+
+    def close(self):
+        pass
+
+    def send_messages(self, emails):
+        for email in emails:
+            if len(self.sent) == self.fail_at and not self.failed:
+                self.failed = True
+                raise self.error
+            self.sent.append(email)
+        return len(emails)
+
+
+def _make_emails(count):
+    return [EmailMessage('subject {}'.format(i), 'body', 'from@email.org', ['to{}@email.org'.format(i)])
+            for i in range(count)]
+
+
+class MailSenderTest(SimpleTestCase):
+
+    def test_reconnect_sends_only_unsent_emails(self):
+        connection = FailingConnection(2, smtplib.SMTPServerDisconnected())
+        emails = _make_emails(5)
+        with MailSender(batch_size=10, connection=connection, rate_limited=False) as sender:
+            self.assertEqual(sender.send(emails), 5)
+        self.assertEqual(connection.sent, emails)
+        self.assertEqual(connection.opened, 2)
+
+    def test_refused_recipient_not_retried(self):
+        connection = FailingConnection(2, smtplib.SMTPRecipientsRefused({}))
+        emails = _make_emails(5)
+        with self.assertRaises(smtplib.SMTPRecipientsRefused):
+            with MailSender(batch_size=10, connection=connection, rate_limited=False) as sender:
+                sender.send(emails)
+        self.assertEqual(connection.sent, emails[:2])
+        self.assertEqual(connection.opened, 1)
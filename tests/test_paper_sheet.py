@@ -0,0 +1,253 @@
+##############################################################################
+#
+#    OSIS stands for Open Student Information System. It's an application
+#    designed to manage the core business of higher education institutions,
+#    such as universities, faculties, institutes and professional schools.
+#    The core business involves the administration of students, teachers,
+#    courses, programs and so on.
+#
+#    Copyright (C) 2015-2016 Université catholique de Louvain (http://www.uclouvain.be)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    A copy of this license - GNU General Public License - is available
+#    at the root of the source code of this program.  If not,
+#    see http://www.gnu.org/licenses/.
+#
+##############################################################################
+import json
+import os
+import tempfile
+import uuid
+import zipfile
+from io import BytesIO
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from PyPDF2 import PdfFileReader
+
+from osis_common.document import paper_sheet, paper_sheet_jobs, xls_scores_sheet
+from osis_common.models.paper_sheet_job import PaperSheetJob
+
+
+def _make_enrollments(count):
+    return [{'registration_id': '{:08d}'.format(i),
+             'last_name': 'Lastname{}'.format(i),
+             'first_name': 'Firstname{}'.format(i),
+             'score': '',
+             'justification': ''} for i in range(count)]
+
+
+def _make_document(enrollments_counts):
+    return {'justification_legend': 'Legend',
+            'learning_unit_years': [{'acronym': 'LDROI1001',
+                                     'title': 'Learning unit',
+                                     'academic_year': '2016-2017',
+                                     'session_number': 1,
+                                     'decimal_scores': False,
+                                     'coordinator': None,
+                                     'programs': [{'acronym': 'DROI1BA',
+                                                   'deadline': None,
+                                                   'deliberation_date': None,
+                                                   'address': {},
+                                                   'enrollments': _make_enrollments(count)}
+                                                  for count in enrollments_counts]}]}
+
+
+def _get_page_numbers(pdf):
+    reader = PdfFileReader(BytesIO(pdf))
+    page_numbers = []
+    for index in range(reader.getNumPages()):
+        text = reader.getPage(index).extractText()
+        page_numbers.append(int(text[text.index('Page ') + len('Page '):].split()[0]))
+    return page_numbers
+
+
+class PaperSheetTest(SimpleTestCase):
+
+    def test_split_document(self):
+        parts = paper_sheet._split_document(_make_document([30, 0, 24, 1]))
+        self.assertEqual([first_page for part, first_page in parts], [1, 3, 3, 4])
+        for part, first_page in parts:
+            self.assertEqual(len(part['learning_unit_years']), 1)
+            self.assertEqual(len(part['learning_unit_years'][0]['programs']), 1)
+
+    def test_build_pdf(self):
+        pdf = paper_sheet.build_pdf(_make_document([30, 2]))
+        self.assertTrue(pdf.startswith(b'%PDF'))
+
+    def test_build_pdf_in_parallel(self):
+        document = _make_document([30, 0, 24, 1])
+        page_numbers = _get_page_numbers(paper_sheet.build_pdf(document, workers=1))
+        self.assertEqual(page_numbers, list(range(1, len(page_numbers) + 1)))
+        self.assertEqual(_get_page_numbers(paper_sheet.build_pdf(document, workers=2)), page_numbers)
+
+    def test_parallel_parts_renumbered(self):
+        document = _make_document([30, 0, 24, 1])
+        page_numbers = _get_page_numbers(paper_sheet.build_pdf(document, workers=1))
+        # Wrong estimates of the first pages of the parts
+        parts = [(part, 1) for part, first_page in paper_sheet._split_document(document)]
+        output = BytesIO()
+        paper_sheet._write_pdf_in_parallel(parts, 2, output)
+        self.assertEqual(_get_page_numbers(output.getvalue()), page_numbers)
+
+    def test_parallel_progress(self):
+        progresses = []
+        paper_sheet.write_pdf(_make_document([30, 2]), BytesIO(), workers=2, progress=progresses.append)
+        self.assertEqual(progresses, sorted(progresses))
+        self.assertLess(max(progresses[:-1]), 100)
+        self.assertEqual(progresses[-1], 100)
+
+    def test_build_response(self):
+        response = paper_sheet.build_response(_make_document([30, 2]))
+        pdf = b''.join(response.streaming_content)
+        self.assertTrue(pdf.startswith(b'%PDF'))
+        self.assertEqual(int(response['Content-Length']), len(pdf))
+
+    def test_cached_pdf(self):
+        with tempfile.TemporaryDirectory() as cache_dir, override_settings(PAPER_SHEET_CACHE_DIR=cache_dir):
+            document = _make_document([30, 2])
+            pdf = paper_sheet.build_pdf(document)
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+            self.assertEqual(paper_sheet.build_pdf(_make_document([30, 2])), pdf)
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+            paper_sheet.build_pdf(_make_document([30, 3]))
+            self.assertEqual(len(os.listdir(cache_dir)), 2)
+            with override_settings(PAPER_SHEET_CACHE_MAX_SIZE=0):
+                self.assertTrue(paper_sheet.build_pdf(_make_document([30, 4])).startswith(b'%PDF'))
+                self.assertEqual(len(os.listdir(cache_dir)), 1)
+
+    def test_cached_pdf_by_printing_date(self):
+        with tempfile.TemporaryDirectory() as cache_dir, override_settings(PAPER_SHEET_CACHE_DIR=cache_dir):
+            paper_sheet.build_pdf(_make_document([30, 2]))
+            with mock.patch('osis_common.document.paper_sheet._get_printing_date', return_value='01/01/2099'):
+                paper_sheet.build_pdf(_make_document([30, 2]))
+            self.assertEqual(len(os.listdir(cache_dir)), 2)
+
+    def test_cached_pdf_removed_before_opening(self):
+        with tempfile.TemporaryDirectory() as cache_dir, override_settings(PAPER_SHEET_CACHE_DIR=cache_dir), \
+                mock.patch('osis_common.document.paper_sheet._get_cached_pdf',
+                           return_value=os.path.join(cache_dir, 'removed.pdf')):
+            response = paper_sheet.build_response(_make_document([30, 2]))
+            pdf = b''.join(response.streaming_content)
+            self.assertTrue(pdf.startswith(b'%PDF'))
+            self.assertEqual(int(response['Content-Length']), len(pdf))
+            self.assertTrue(paper_sheet.build_pdf(_make_document([30, 2])).startswith(b'%PDF'))
+
+    def test_write_pdf_progress(self):
+        progresses = []
+        paper_sheet.write_pdf(_make_document([30, 2]), BytesIO(), progress=progresses.append)
+        self.assertTrue(progresses)
+        self.assertEqual(progresses, sorted(progresses))
+        self.assertLessEqual(progresses[-1], 100)
+
+    def test_students_rows(self):
+        enrollments = _make_enrollments(3)
+        enrollments[0]['last_name'] = 'Lastname ' * 20
+        for enrollment in enrollments:
+            enrollment['justification'] = 'absent'
+        justifications = {}
+        rows = paper_sheet._students_rows(enrollments, paper_sheet.get_styles(), justifications)
+        self.assertIsInstance(rows[0][1], paper_sheet.Paragraph)
+        self.assertEqual(rows[1][1], 'Lastname1')
+        self.assertIs(rows[0][4], rows[2][4])
+        self.assertEqual(len(justifications), 1)
+
+    def test_build_xlsx_response(self):
+        document = _make_document([30, 2])
+        response = xls_scores_sheet.build_response(document)
+        xlsx = b''.join(response.streaming_content)
+        self.assertEqual(int(response['Content-Length']), len(xlsx))
+        with zipfile.ZipFile(BytesIO(xlsx)) as workbook:
+            self.assertEqual(workbook.read('xl/workbook.xml').decode('utf-8').count('<sheet '), 2)
+            worksheet = workbook.read('xl/worksheets/sheet1.xml').decode('utf-8')
+        # 5 rows of information, the header and the 30 students
+        self.assertEqual(worksheet.count('<row '), 36)
+        self.assertIn('Lastname29', worksheet)
+
+    @override_settings(PAPER_SHEET_XLSX_MAX_SHEETS=1)
+    def test_xlsx_max_sheets(self):
+        with self.assertRaises(ValueError):
+            xls_scores_sheet.write_xlsx(_make_document([1, 1]), BytesIO())
+
+    def test_xlsx_sheet_names(self):
+        document = _make_document([1, 1])
+        sheet_names = set()
+        learn_unit_year = document['learning_unit_years'][0]
+        names = [xls_scores_sheet._get_sheet_name(learn_unit_year, program, sheet_names)
+                 for program in learn_unit_year['programs']]
+        self.assertEqual(names, ['LDROI1001 DROI1BA', 'LDROI1001 DROI1BA (2)'])
+
+
+class PaperSheetJobsTest(TestCase):
+
+    def setUp(self):
+        # The jobs and the DocumentFile are not sent to the queue server
+        queue_sender_patcher = mock.patch('osis_common.queue.queue_sender.send_message')
+        self.send_message = queue_sender_patcher.start()
+        self.addCleanup(queue_sender_patcher.stop)
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media_root_settings = override_settings(MEDIA_ROOT=media_root.name)
+        media_root_settings.enable()
+        self.addCleanup(media_root_settings.disable)
+
+    def _submit_and_process(self, document):
+        job_uuid = paper_sheet_jobs.submit(document, requested_by='user')
+        queue_name, data = self.send_message.call_args[0]
+        paper_sheet_jobs.process_job(json.dumps(data).encode('utf-8'))
+        return job_uuid
+
+    def test_submit(self):
+        document = _make_document([2])
+        job_uuid = paper_sheet_jobs.submit(document, requested_by='user')
+        queue_name, data = self.send_message.call_args[0]
+        self.assertEqual(queue_name, paper_sheet_jobs.get_queue_name())
+        self.assertEqual(data['job_uuid'], str(job_uuid))
+        self.assertEqual(data['document'], document)
+        self.assertEqual(paper_sheet_jobs.get_status(job_uuid), {'status': PaperSheetJob.PENDING,
+                                                                 'progress': 0,
+                                                                 'document_file_id': None,
+                                                                 'error': None})
+
+    def test_process_job(self):
+        job_uuid = self._submit_and_process(_make_document([30, 2]))
+        status = paper_sheet_jobs.get_status(job_uuid)
+        self.assertEqual(status['status'], PaperSheetJob.DONE)
+        self.assertEqual(status['progress'], 100)
+        document_file = PaperSheetJob.objects.get(uuid=job_uuid).document_file
+        self.assertEqual(document_file.id, status['document_file_id'])
+        self.assertEqual(document_file.content_type, 'application/pdf')
+        self.assertEqual(document_file.update_by, 'user')
+        with document_file.file.open('rb') as pdf_file:
+            pdf = pdf_file.read()
+        self.assertTrue(pdf.startswith(b'%PDF'))
+        self.assertEqual(document_file.size, len(pdf))
+
+    @override_settings(PAPER_SHEET_WORKERS=2)
+    def test_process_job_redelivered(self):
+        job_uuid = self._submit_and_process(_make_document([30, 2]))
+        document_file_id = paper_sheet_jobs.get_status(job_uuid)['document_file_id']
+        queue_name, data = self.send_message.call_args[0]
+        paper_sheet_jobs.process_job(json.dumps(data).encode('utf-8'))
+        self.assertEqual(paper_sheet_jobs.get_status(job_uuid)['document_file_id'], document_file_id)
+
+    def test_process_job_failed(self):
+        with self.assertRaises(TypeError):
+            self._submit_and_process(dict(_make_document([2]), learning_unit_years=None))
+        job = PaperSheetJob.objects.get()
+        status = paper_sheet_jobs.get_status(job.uuid)
+        self.assertEqual(status['status'], PaperSheetJob.FAILED)
+        self.assertIsNone(status['document_file_id'])
+        self.assertTrue(status['error'].startswith('TypeError'))
+
+    def test_status_of_unknown_job(self):
+        self.assertIsNone(paper_sheet_jobs.get_status(uuid.uuid4()))
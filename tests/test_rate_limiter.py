@@ -0,0 +1,87 @@
+##############################################################################
+#
+#    OSIS stands for Open Student Information System. It's an application
+#    designed to manage the core business of higher education institutions,
+#    such as universities, faculties, institutes and professional schools.
+#    The core business involves the administration of students, teachers,
+#    courses, programs and so on.
+#
+#    Copyright (C) 2015-2016 Université catholique de Louvain (http://www.uclouvain.be)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    A copy of this license - GNU General Public License - is available
+#    at the root of the source code of this program.  If not,
+#    see http://www.gnu.org/licenses/.
+#
+##############################################################################
+from django.test import SimpleTestCase, override_settings
+
+from osis_common.messaging import rate_limiter
+from osis_common.messaging.rate_limiter import TokenBucket, RateLimiter
+
+
+class TokenBucketTest(SimpleTestCase):
+
+    def test_acquire_until_empty(self):
+        bucket = TokenBucket(rate=1, capacity=3)
+        self.assertEqual(bucket.try_acquire(2), 0)
+        self.assertEqual(bucket.try_acquire(1), 0)
+        self.assertGreater(bucket.try_acquire(1), 0)
+
+    def test_acquire_more_than_capacity(self):
+        bucket = TokenBucket(rate=1, capacity=3)
+        self.assertEqual(bucket.try_acquire(10), 0)
+        # The 7 tokens of debt and the requested token have to be refilled
+        self.assertGreater(bucket.try_acquire(1), 7)
+
+    def test_acquire_more_than_capacity_when_not_full(self):
+        bucket = TokenBucket(rate=1, capacity=3)
+        bucket.try_acquire(1)
+        self.assertGreater(bucket.try_acquire(10), 0)
+
+
+class RateLimiterTest(SimpleTestCase):
+
+    def setUp(self):
+        self.rate_limiter = RateLimiter(rate=1, burst=10, domain_rate=1, domain_burst=2, max_concurrency=1)
+
+    def test_domain_limit(self):
+        self.assertEqual(self.rate_limiter.try_acquire(['a@uclouvain.be', 'b@uclouvain.be']), 0)
+        self.assertGreater(self.rate_limiter.try_acquire(['c@uclouvain.be']), 0)
+        self.assertEqual(self.rate_limiter.try_acquire(['c@gmail.com']), 0)
+
+    def test_tokens_given_back_when_limited(self):
+        self.rate_limiter.bucket.try_acquire(10)
+        self.assertGreater(self.rate_limiter.try_acquire(['a@uclouvain.be']), 0)
+        self.assertEqual(self.rate_limiter._get_domain_bucket('uclouvain.be').try_acquire(2), 0)
+
+    def test_acquire_timeout(self):
+        self.rate_limiter.try_acquire(['a@uclouvain.be', 'b@uclouvain.be'])
+        self.assertFalse(self.rate_limiter.acquire(['c@uclouvain.be'], timeout=0.01))
+
+    def test_metrics(self):
+        self.rate_limiter.count('sent', 3)
+        self.rate_limiter.count('deferred')
+        self.assertEqual(self.rate_limiter.get_metrics(), {'queued': 0, 'sent': 3, 'deferred': 1})
+
+
+class GetRateLimiterTest(SimpleTestCase):
+
+    def test_rebuilt_when_settings_change(self):
+        with override_settings(EMAIL_RATE_LIMITS={'RATE': 10}):
+            first_rate_limiter = rate_limiter.get_rate_limiter()
+            self.assertIs(rate_limiter.get_rate_limiter(), first_rate_limiter)
+        with override_settings(EMAIL_RATE_LIMITS={'RATE': 1}):
+            self.assertIsNot(rate_limiter.get_rate_limiter(), first_rate_limiter)
+            self.assertEqual(rate_limiter.get_rate_limiter().bucket.rate, 1)
+        with override_settings(EMAIL_RATE_LIMITS=None):
+            self.assertIsNone(rate_limiter.get_rate_limiter())
@@ -0,0 +1,76 @@
+##############################################################################
+#
+#    OSIS stands for Open Student Information System. It's an application
+#    designed to manage the core business of higher education institutions,
+#    such as universities, faculties, institutes and professional schools.
+#    The core business involves the administration of students, teachers,
+#    courses, programs and so on.
+#
+#    Copyright (C) 2015-2016 Université catholique de Louvain (http://www.uclouvain.be)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    A copy of this license - GNU General Public License - is available
+#    at the root of the source code of this program.  If not,
+#    see http://www.gnu.org/licenses/.
+#
+##############################################################################
+import json
+import uuid
+
+from django.test import TestCase
+
+from osis_common.scripts import reconciliation
+from osis_common.tests.models_for_tests.serializable_tests_models import ModelWithoutUser
+
+
+def _answer(request):
+    return json.loads(reconciliation.answer_request(json.dumps(request).encode('utf-8')))
+
+
+class ReconciliationTest(TestCase):
+
+    def setUp(self):
+        # Created in bulk : the save of a serializable model sends it to the queue server
+        ModelWithoutUser.objects.bulk_create([
+            ModelWithoutUser(uuid=uuid.UUID(int=0), name='First'),
+            ModelWithoutUser(uuid=uuid.UUID(int=1), name='Second'),
+            ModelWithoutUser(uuid=uuid.UUID(int=2 ** 128 - 1), name='Last')])
+        self.label = ModelWithoutUser._meta.label
+
+    def test_get_bucket(self):
+        self.assertEqual(reconciliation.get_bucket(uuid.UUID(int=0)), 0)
+        self.assertEqual(reconciliation.get_bucket(str(uuid.UUID(int=2 ** 128 - 1))), reconciliation.NB_BUCKETS - 1)
+        self.assertEqual(reconciliation.get_bucket('80000000-0000-0000-0000-000000000000'),
+                         reconciliation.NB_BUCKETS // 2)
+
+    def test_compute_bucket_hashes(self):
+        bucket_hashes = reconciliation.compute_bucket_hashes(reconciliation.iter_row_digests(ModelWithoutUser))
+        self.assertEqual(set(bucket_hashes), {0, reconciliation.NB_BUCKETS - 1})
+        ModelWithoutUser.objects.filter(name='Second').update(name='Modified')
+        modified_bucket_hashes = reconciliation.compute_bucket_hashes(
+            reconciliation.iter_row_digests(ModelWithoutUser))
+        self.assertNotEqual(modified_bucket_hashes[0], bucket_hashes[0])
+        self.assertEqual(modified_bucket_hashes[reconciliation.NB_BUCKETS - 1],
+                         bucket_hashes[reconciliation.NB_BUCKETS - 1])
+
+    def test_answer_bucket_hashes_request(self):
+        bucket_hashes = _answer({'model': self.label}).get('bucket_hashes')
+        expected_bucket_hashes = reconciliation.compute_bucket_hashes(
+            reconciliation.iter_row_digests(ModelWithoutUser))
+        self.assertEqual(bucket_hashes, {str(bucket): bucket_hash
+                                         for bucket, bucket_hash in expected_bucket_hashes.items()})
+
+    def test_answer_digests_request(self):
+        digests = _answer({'model': self.label, 'buckets': [0]}).get('digests')
+        self.assertEqual(set(digests), {str(uuid.UUID(int=0)), str(uuid.UUID(int=1))})
+        self.assertEqual(digests[str(uuid.UUID(int=0))],
+                         reconciliation.get_row_digest(ModelWithoutUser.objects.get(name='First')))
@@ -0,0 +1,100 @@
+##############################################################################
+#
+#    OSIS stands for Open Student Information System. It's an application
+#    designed to manage the core business of higher education institutions,
+#    such as universities, faculties, institutes and professional schools.
+#    The core business involves the administration of students, teachers,
+#    courses, programs and so on.
+#
+#    Copyright (C) 2015-2016 Université catholique de Louvain (http://www.uclouvain.be)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    A copy of this license - GNU General Public License - is available
+#    at the root of the source code of this program.  If not,
+#    see http://www.gnu.org/licenses/.
+#
+##############################################################################
+import re
+
+from django.test import SimpleTestCase, override_settings
+
+from osis_common.messaging import table_renderer
+
+TABLE_HEADERS = ['acronym', 'registration_number', 'lastname', 'score']
+TABLE_ROWS = [('DROI1BA', '001', 'Person & Co', 12.5),
+              ('DROI1BA', '002', '<b>Person2</b>', None)]
+
+
+def _without_spaces(text):
+    return re.sub(r'\s+', '', text)
+
+
+class RenderTableTest(SimpleTestCase):
+
+    def test_cached_table(self):
+        rendered_table = table_renderer.render_table(TABLE_HEADERS, TABLE_ROWS, True, 'cache')
+        self.assertIs(table_renderer.render_table(TABLE_HEADERS, TABLE_ROWS, True, 'cache'), rendered_table)
+
+    def test_fast_path_html_same_as_template(self):
+        with override_settings(EMAIL_TABLE_FAST_PATH_ROWS=1000):
+            rendered_by_template = table_renderer.render_table(TABLE_HEADERS, TABLE_ROWS, True, 'template')
+        with override_settings(EMAIL_TABLE_FAST_PATH_ROWS=0):
+            built_table = table_renderer.render_table(TABLE_HEADERS, TABLE_ROWS, True, 'fast_path')
+        self.assertEqual(_without_spaces(built_table), _without_spaces(rendered_by_template))
+
+    def test_fast_path_txt_same_as_template(self):
+        with override_settings(EMAIL_TABLE_FAST_PATH_ROWS=1000):
+            rendered_by_template = table_renderer.render_table(TABLE_HEADERS, TABLE_ROWS, False, 'template')
+        with override_settings(EMAIL_TABLE_FAST_PATH_ROWS=0):
+            built_table = table_renderer.render_table(TABLE_HEADERS, TABLE_ROWS, False, 'fast_path')
+        self.assertEqual(built_table, rendered_by_template)
+
+    def test_fast_path_by_chunks_same_as_template(self):
+        table_rows = TABLE_ROWS * (table_renderer.ROWS_PER_CHUNK + 1)
+        for html_format in (True, False):
+            with override_settings(EMAIL_TABLE_FAST_PATH_ROWS=10000):
+                rendered_by_template = table_renderer.render_table(TABLE_HEADERS, table_rows, html_format, 'template')
+            with override_settings(EMAIL_TABLE_FAST_PATH_ROWS=0):
+                built_table = table_renderer.render_table(TABLE_HEADERS, table_rows, html_format, 'fast_path')
+            self.assertEqual(_without_spaces(built_table), _without_spaces(rendered_by_template))
+
+
+class PrepareTablesTest(SimpleTestCase):
+
+    def _create_table(self, data):
+        return {'table_template_name': 'scores_table', 'header_txt': TABLE_HEADERS, 'data': data}
+
+    def test_small_table_kept_inline(self):
+        table = table_renderer.prepare_tables([self._create_table(row for row in TABLE_ROWS)])[0]
+        self.assertFalse(table_renderer.is_spilled(table))
+        self.assertEqual(table.get('data'), TABLE_ROWS)
+
+    @override_settings(EMAIL_TABLE_MAX_INLINE_ROWS=1)
+    def test_big_table_spilled_to_csv(self):
+        table = table_renderer.prepare_tables([self._create_table(row for row in TABLE_ROWS)])[0]
+        self.assertTrue(table_renderer.is_spilled(table))
+        name, content, mimetype = table_renderer.get_spilled_table_attachment(table, TABLE_HEADERS)
+        self.assertEqual(name, 'scores_table.csv')
+        self.assertEqual(mimetype, 'text/csv')
+        self.assertEqual(content.decode('utf-8').splitlines(),
+                         ['acronym,registration_number,lastname,score',
+                          'DROI1BA,001,Person & Co,12.5',
+                          'DROI1BA,002,<b>Person2</b>,'])
+
+    @override_settings(EMAIL_TABLE_MAX_INLINE_ROWS=1)
+    def test_spilled_table_attachments_by_language(self):
+        table = table_renderer.prepare_tables([self._create_table(row for row in TABLE_ROWS)])[0]
+        french_headers = ['sigle', 'noma', 'nom', 'note']
+        name, content_fr, mimetype = table_renderer.get_spilled_table_attachment(table, french_headers)
+        name, content_en, mimetype = table_renderer.get_spilled_table_attachment(table, TABLE_HEADERS)
+        self.assertEqual(content_fr.decode('utf-8').splitlines()[0], 'sigle,noma,nom,note')
+        self.assertEqual(content_fr.decode('utf-8').splitlines()[1:], content_en.decode('utf-8').splitlines()[1:])